@@ -58,6 +58,7 @@ class CheckBlackhole(Commander):
         # in the initial sync just like everyone else. Drop the connection after.
         self.log.info("Temporarily connecting the isolated victim to the source")
         victim.addnode(source_p2p, "onetry")
+        self.invalidate_peers(victim)
         self.log.info("Mining 101 blocks and syncing the whole network")
         self.generatetoaddress(source, 101, addr)
         height = source.getblockcount()
@@ -65,10 +66,10 @@ class CheckBlackhole(Commander):
         # Drop the temporary link: the victim is now fully synced but its only
         # remaining peer is the blackhole.
         self.log.info("Dropping the temporary link to isolate the victim")
-        for p in victim.getpeerinfo():
-            if source.rpchost in p["addr"]:
-                victim.disconnectnode("", p["id"])
-        self.wait_until(lambda: len(victim.getpeerinfo()) == 1, timeout=self.options.timeout)
+        for p in self.peers(victim).by_address(source.rpchost):
+            victim.disconnectnode("", p["id"])
+        self.invalidate_peers(victim)
+        self.wait_until(lambda: len(self.peers(victim, max_age=0)) == 1, timeout=self.options.timeout)
         self.log.info(f"Victim isolated")
 
         # Test block propagation.
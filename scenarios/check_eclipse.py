@@ -40,10 +40,11 @@ class CheckEclipse(Commander):
             time.sleep(1)
         return predicate()
 
-    # Aggregate a node's received bytes-per-message-type across all its peers.
-    def recv_bytes(self, node):
+    # Aggregate a node's received bytes-per-message-type across all its peers, from a snapshot at
+    # most `max_age` seconds old (see Commander.peers).
+    def recv_bytes(self, node, max_age=None):
         c = Counter()
-        for peer in node.getpeerinfo():
+        for peer in self.peers(node, max_age=max_age):
             for msgtype, nbytes in peer.get("bytesrecv_per_msg", {}).items():
                 c[msgtype] += nbytes
         return c
@@ -57,9 +58,10 @@ class CheckEclipse(Commander):
         self.wait_for_tanks_connected()
         # The victim's baseline (addnode -> blackholes) is built of manual connections, its honest
         # lifeline is the addconnection extras (outbound-full-{relay, recon}).
-        outbound = [p for p in victim.getpeerinfo() if not p["inbound"]]
+        victim_peers = self.peers(victim)
+        outbound = victim_peers.outbound
         lifeline = [p for p in outbound if p["connection_type"] != "manual"]
-        baseline_peers = len(victim.getpeerinfo())
+        baseline_peers = len(victim_peers)
         self.log.info(f"Eclipse setup: {len(honest)}-node honest mesh; victim has {len(outbound)} outbound "
                       f"({len(lifeline)} honest lifeline / {len(outbound) - len(lifeline)} blackhole baseline)")
 
@@ -69,17 +71,19 @@ class CheckEclipse(Commander):
 
         self.log.info("Temporarily linking the victim to the miner to feed it the chain")
         victim.addnode(miner_p2p, "onetry")
+        self.invalidate_peers(victim)
         self.log.info("Mining 120 blocks and syncing the whole network")
         self.generatetoaddress(miner_node, 120, addr)
         height = miner_node.getblockcount()
 
         self.log.info("Dropping the temporary link to seal the eclipse")
-        for p in victim.getpeerinfo():
-            if miner_node.rpchost in p["addr"]:
-                victim.disconnectnode("", p["id"])
-        self.wait_until(lambda: len(victim.getpeerinfo()) == baseline_peers, timeout=self.options.timeout)
+        for p in self.peers(victim).by_address(miner_node.rpchost):
+            victim.disconnectnode("", p["id"])
+        self.invalidate_peers(victim)
+        self.wait_until(lambda: len(self.peers(victim, max_age=0)) == baseline_peers, timeout=self.options.timeout)
         self.log.info(f"Victim pre-synced to height {height}, eclipse sealed ({baseline_peers} peers)")
 
+        # Shares the snapshot the wait above ended on
         before = self.recv_bytes(victim)
 
         # Make sure the victim is actually eclipsed for blocks by generating an extra block
@@ -107,7 +111,7 @@ class CheckEclipse(Commander):
         got_all = self.poll(lambda: all(t in victim.getrawmempool() for t in txids), self.options.timeout)
         vmempool = set(victim.getrawmempool())
         received = sum(1 for t in txids if t in vmempool)
-        diff = self.recv_bytes(victim) - before  # bytes the victim received during the broadcast phase
+        diff = self.recv_bytes(victim, max_age=0) - before  # bytes the victim received during the broadcast phase
 
         # Check propagation as the time between the first received inv (by any node) to the last received
         # transaction time. We exclude the source when computing, as it has no first_inv_time nor recv_time
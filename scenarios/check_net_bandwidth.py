@@ -2,7 +2,6 @@
 
 from collections import Counter
 from decimal import Decimal
-import logging
 import statistics
 import threading
 import time
@@ -45,18 +44,15 @@ def generate_transaction(wallet_rpc, utxo):
     return signed_tx["hex"]
 
 class CheckNetBandwidth(Commander):
+    # An observer's inv/getdata traffic would be counted in getnetmsgstats
+    arrivals_supported = False
+
     def set_test_params(self):
         super().set_test_params()
         self.num_nodes = 1
         self.inv_timestamps = []
         self.tx_timestamps = []
 
-    def wait_for_tanks_connected(self):
-        # Increasing the log level momentarily so wait_for_tanks doesn't blow our stdout
-        self.log.setLevel(logging.WARN)
-        super().wait_for_tanks_connected()
-        self.log.setLevel(logging.INFO)
-
     def add_options(self, parser):
         parser.description = (
             "Creates an network simulation by creating tx_count transaction and sending them from "
@@ -259,7 +255,8 @@ class CheckNetBandwidth(Commander):
         # make this hard to compute.
         offenders = []
         for node in self.nodes:
-            for peer in node.getpeerinfo():
+            # Transports don't change over a connection's life, so a recent snapshot will do
+            for peer in self.peers(node):
                 # Missing field means a pre-v2 node, whose connections are all v1.
                 actual = peer.get("transport_protocol_type", "v1")
                 if actual != transport:
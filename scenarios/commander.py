@@ -1,33 +1,49 @@
 import argparse
 import base64
 import configparser
+import hashlib
+import http.client
 import json
 import logging
 import os
-import pathlib
 import random
 import signal
 import sys
 import tempfile
-import threading
-from time import sleep
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep
 
-from kubernetes import client, config
+from kubernetes import client, config, watch
 from ln_framework.ln import LND
 
-from test_framework.authproxy import AuthServiceProxy
+from test_framework.async_authproxy import AsyncAuthServiceProxy
+from test_framework.authproxy import AuthServiceProxy, JSONRPCException
 from test_framework.p2p import NetworkThread
+from test_framework.p2p_observer import OBSERVER_SUBVERSION, P2PObserver
+from test_framework.rpc_metrics import RPCMetrics
 from test_framework.test_framework import (
     TMPDIR_PREFIX,
     BitcoinTestFramework,
     TestStatus,
 )
-from test_framework.test_node import TestNode
 from test_framework.util import PortSeed, get_rpc_proxy
 
 NAMESPACE = None
-pods = client.V1PodList(items=[])
-cmaps = client.V1ConfigMapList(items=[])
+sclient = None
+# Page size of the Kubernetes list calls, so shared clusters are listed in bounded chunks
+LIST_PAGE_SIZE = 500
+# wait_for_tanks_connected() polls tanks between these many seconds apart, backing off while
+# nothing changes, and reports progress every READY_REPORT_INTERVAL seconds
+READY_POLL_MIN = 0.25
+READY_POLL_MAX = 5
+READY_REPORT_INTERVAL = 10
+# Seconds a pod watch runs before wait_for_pods_ready() falls back to listing pods
+READY_WATCH_TIMEOUT = 60
+# Seconds between the getpeerinfo sweeps of connect_many()
+CONNECT_POLL_INTERVAL = 0.1
+# P2P port of every tank
+P2P_PORT = 18444
 
 try:
     # Get the in-cluster k8s client to determine what we have access to
@@ -37,62 +53,245 @@ try:
     # Figure out what namespace we are in
     with open("/var/run/secrets/kubernetes.io/serviceaccount/namespace") as f:
         NAMESPACE = f.read().strip()
+except Exception:
+    # If there is no cluster config, the user might just be
+    # running the scenario file locally with --help
+    pass
+
+# Filled on the first Commander.setup(), see discover_warnet() and load_snapshot()
+WARNET = {"tanks": [], "lightning": [], "channels": []}
+_discovered = False
+SNAPSHOT_VERSION = 1
+
 
+def list_labeled(kind, label_selector):
+    """Yield every `kind` ("pod" or "config_map") matching `label_selector`, page by page.
+
+    Filtering happens server-side, so a shared cluster only returns warnet's own objects."""
+    kwargs = {"label_selector": label_selector, "limit": LIST_PAGE_SIZE}
     try:
         # An admin with cluster access can list everything.
         # A wargames player with namespaced access will get a FORBIDDEN error here
-        pods = sclient.list_pod_for_all_namespaces()
-        cmaps = sclient.list_config_map_for_all_namespaces()
+        list_call = getattr(sclient, f"list_{kind}_for_all_namespaces")
+        page = list_call(**kwargs)
     except Exception:
         # Just get whatever we have access to in this namespace only
-        pods = sclient.list_namespaced_pod(namespace=NAMESPACE)
-        cmaps = sclient.list_namespaced_config_map(namespace=NAMESPACE)
-except Exception:
-    # If there is no cluster config, the user might just be
-    # running the scenario file locally with --help
-    pass
+        list_call = getattr(sclient, f"list_namespaced_{kind}")
+        kwargs["namespace"] = NAMESPACE
+        page = list_call(**kwargs)
 
-WARNET = {"tanks": [], "lightning": [], "channels": []}
-for pod in pods.items:
-    if "mission" not in pod.metadata.labels:
-        continue
-
-    if pod.metadata.labels["mission"] == "tank":
-        WARNET["tanks"].append(
-            {
-                "tank": pod.metadata.name,
-                "chain": pod.metadata.labels["chain"],
-                "rpc_host": pod.status.pod_ip,
-                "rpc_port": int(pod.metadata.labels["RPCPort"]),
-                "rpc_user": "user",
-                "rpc_password": pod.metadata.labels["rpcpassword"],
-                "init_peers": pod.metadata.annotations["init_peers"],
-            }
-        )
+    while True:
+        yield from page.items
+        if not page.metadata._continue:
+            return
+        page = list_call(_continue=page.metadata._continue, **kwargs)
+
+
+def discover_warnet():
+    """Build the WARNET index of tanks, lightning nodes and channels, once, on first use."""
+    global _discovered
+    if _discovered or sclient is None:
+        return WARNET
+
+    for pod in list_labeled("pod", "mission in (tank,lightning)"):
+        if pod.metadata.labels["mission"] == "tank":
+            WARNET["tanks"].append(
+                {
+                    "tank": pod.metadata.name,
+                    "namespace": pod.metadata.namespace,
+                    "chain": pod.metadata.labels["chain"],
+                    "rpc_host": pod.status.pod_ip,
+                    "rpc_port": int(pod.metadata.labels["RPCPort"]),
+                    "rpc_user": "user",
+                    "rpc_password": pod.metadata.labels["rpcpassword"],
+                    "init_peers": pod.metadata.annotations["init_peers"],
+                }
+            )
+        else:
+            WARNET["lightning"].append(pod.metadata.name)
+
+    for cm in list_labeled("config_map", "channels"):
+        channel_jsons = json.loads(cm.data["channels"])
+        for channel_json in channel_jsons:
+            channel_json["source"] = cm.data["source"]
+            WARNET["channels"].append(channel_json)
+
+    _discovered = True
+    return WARNET
+
+
+def snapshot_digest(warnet):
+    """Short, stable fingerprint of a deployment index, to tie results to what they ran on."""
+    return hashlib.sha256(json.dumps(warnet, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def save_snapshot(path, warnet):
+    """Write a deployment index, as built by discover_warnet(), to `path` as JSON."""
+    with open(path, "w") as f:
+        snapshot = {
+            "version": SNAPSHOT_VERSION,
+            "namespace": NAMESPACE,
+            "digest": snapshot_digest(warnet),
+            "warnet": warnet,
+        }
+        json.dump(snapshot, f, indent=2)
+
+
+def load_snapshot(path):
+    """Fill WARNET from a snapshot written by save_snapshot(), skipping Kubernetes discovery."""
+    global _discovered
+    with open(path) as f:
+        snapshot = json.load(f)
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"unsupported snapshot version {snapshot.get('version')} in {path}")
+    for key in WARNET:
+        WARNET[key] = snapshot["warnet"][key]
+    _discovered = True
+    return WARNET
+
+
+class RemoteTank:
+    """
+    Handle to a deployed tank, used by Commander in place of a TestNode.
+
+    TestNode also models the bitcoind process a functional test starts (datadir, perf, valgrind,
+    ...), none of which applies to a remote tank. Any attribute not defined here is an RPC and goes
+    straight to the RPC proxy, which keeps one HTTP connection per thread alive; `async_rpc` is a
+    pooled asyncio client to the same tank.
+    """
+
+    __slots__ = ("index", "tank", "rpchost", "chain", "init_peers", "rpc", "async_rpc", "cleanup_on_exit")
+
+    def __init__(self, index, tank, rpchost, chain, init_peers, rpc, async_rpc):
+        self.index = index
+        self.tank = tank
+        self.rpchost = rpchost
+        self.chain = chain
+        self.init_peers = init_peers
+        self.rpc = rpc
+        self.async_rpc = async_rpc
+        self.cleanup_on_exit = False
+
+    def __getattr__(self, name):
+        return getattr(self.rpc, name)
+
+    def __repr__(self):
+        return f"RemoteTank({self.tank!r}, {self.rpchost!r})"
+
+    def get_wallet_rpc(self, wallet_name):
+        return self.rpc / "wallet/{}".format(urllib.parse.quote(wallet_name))
+
+    # BitcoinTestFramework.generate*() helpers pass invalid_call
+    def generateblock(self, *args, invalid_call, **kwargs):
+        assert not invalid_call
+        return self.rpc.generateblock(*args, **kwargs)
+
+    def generatetoaddress(self, *args, invalid_call, **kwargs):
+        assert not invalid_call
+        return self.rpc.generatetoaddress(*args, **kwargs)
+
+    def generatetodescriptor(self, *args, invalid_call, **kwargs):
+        assert not invalid_call
+        return self.rpc.generatetodescriptor(*args, **kwargs)
+
+    # Tanks are started and stopped by warnet, not by the scenario
+    def stop_node(self, *args, **kwargs):
+        pass
+
+    def wait_until_stopped(self, *args, **kwargs):
+        pass
+
+
+class PeerSnapshot:
+    """One getpeerinfo result of a tank, with indexes built on first use. The connections of
+    the Commander's own P2P observer (see Commander.observe()) are left out."""
+
+    __slots__ = ("peers", "taken", "_indexes")
+
+    def __init__(self, peers, taken):
+        self.peers = [peer for peer in peers if peer.get("subver") != OBSERVER_SUBVERSION]
+        self.taken = taken
+        self._indexes = {}
+
+    def __len__(self):
+        return len(self.peers)
+
+    def __iter__(self):
+        return iter(self.peers)
+
+    def _index(self, key):
+        index = self._indexes.get(key)
+        if index is None:
+            index = self._indexes[key] = {}
+            for peer in self.peers:
+                index.setdefault(key(peer), []).append(peer)
+        return index
 
-    if pod.metadata.labels["mission"] == "lightning":
-        WARNET["lightning"].append(pod.metadata.name)
+    @staticmethod
+    def _connection_type(peer):
+        return peer.get("connection_type")
+
+    @staticmethod
+    def _transport(peer):
+        # Missing field means a pre-v2 node, whose connections are all v1.
+        return peer.get("transport_protocol_type", "v1")
+
+    @staticmethod
+    def _host(peer):
+        return peer["addr"].rsplit(":", 1)[0].strip("[]")
+
+    @staticmethod
+    def _inbound(peer):
+        return peer["inbound"]
 
-for cm in cmaps.items:
-    if not cm.metadata.labels or "channels" not in cm.metadata.labels:
-        continue
-    channel_jsons = json.loads(cm.data["channels"])
-    for channel_json in channel_jsons:
-        channel_json["source"] = cm.data["source"]
-        WARNET["channels"].append(channel_json)
+    def by_connection_type(self, connection_type):
+        return self._index(self._connection_type).get(connection_type, [])
 
+    def by_transport(self, transport):
+        return self._index(self._transport).get(transport, [])
 
-# Ensure that all RPC calls are made with brand new http connections
-def auth_proxy_request(self, method, path, postdata):
-    self._set_conn()  # creates new http client connection
-    return self.oldrequest(method, path, postdata)
+    def by_address(self, host):
+        """Peers at `host`, an IP without port."""
+        return self._index(self._host).get(host, [])
 
+    @property
+    def inbound(self):
+        return self._index(self._inbound).get(True, [])
 
-AuthServiceProxy.oldrequest = AuthServiceProxy._request
-AuthServiceProxy._request = auth_proxy_request
+    @property
+    def outbound(self):
+        return self._index(self._inbound).get(False, [])
+
+
+def remote_tanks(warnet_tanks, coveragedir=None):
+    """Create the RemoteTank handles of all discovered tanks."""
+    handles = []
+    for i, tank in enumerate(warnet_tanks):
+        rpc_url = f"http://{tank['rpc_user']}:{tank['rpc_password']}@{tank['rpc_host']}:{tank['rpc_port']}"
+        # The coverage wrapper is only worth its per-call overhead when coverage is recorded
+        if coveragedir:
+            rpc = get_rpc_proxy(rpc_url, i, timeout=60, coveragedir=coveragedir)
+        else:
+            rpc = AuthServiceProxy(rpc_url, timeout=60)
+        handles.append(
+            RemoteTank(
+                i,
+                tank["tank"],
+                tank["rpc_host"],
+                tank["chain"],
+                int(tank["init_peers"]),
+                rpc,
+                AsyncAuthServiceProxy(rpc_url, timeout=60),
+            )
+        )
+    return handles
 
 
 class Commander(BitcoinTestFramework):
+    # Whether --arrivals may be used. Scenarios measuring traffic from node-wide counters
+    # (getnetmsgstats), which can't leave the observers' connections out, turn it off.
+    arrivals_supported = True
+
     # required by subclasses of BitcoinTestFramework
     def set_test_params(self):
         self.sclient = sclient
@@ -119,29 +318,201 @@ class Commander(BitcoinTestFramework):
         else:
             return base64.b64decode(b64).hex()
 
+    @staticmethod
+    def pod_ready(pod):
+        conditions = pod.status.conditions or []
+        return any(c.type == "Ready" and c.status == "True" for c in conditions)
+
+    def report_pods_ready(self, pending):
+        total = len(WARNET["tanks"])
+        waiting = ", ".join(name for _, name in sorted(pending)[:5])
+        self.log.info(
+            f"{total - len(pending)}/{total} tank pods ready"
+            + (f" (waiting on {waiting}{', ...' if len(pending) > 5 else ''})" if pending else "")
+        )
+
+    def watch_pods_ready(self, pending, deadline):
+        """Follow a pod watch per namespace, for up to READY_WATCH_TIMEOUT seconds, removing the
+        (namespace, name) of every Ready tank pod from `pending`."""
+        last_report = monotonic()
+        for namespace in {namespace for namespace, _ in pending}:
+            timeout = int(min(READY_WATCH_TIMEOUT, deadline - monotonic()))
+            if timeout <= 0:
+                return
+            w = watch.Watch()
+            # The stream starts by replaying the current state of every pod as ADDED events
+            for event in w.stream(
+                sclient.list_namespaced_pod,
+                namespace=namespace,
+                label_selector="mission=tank",
+                timeout_seconds=timeout,
+            ):
+                pod = event["object"]
+                key = (namespace, pod.metadata.name)
+                if event["type"] == "DELETED":
+                    # Replaced pods have to become Ready again
+                    pending.add(key)
+                elif self.pod_ready(pod):
+                    pending.discard(key)
+                if monotonic() - last_report >= READY_REPORT_INTERVAL:
+                    self.report_pods_ready(pending)
+                    last_report = monotonic()
+                if not any(ns == namespace for ns, _ in pending):
+                    w.stop()
+
+    def poll_pods_ready(self, pending, deadline):
+        """List the tank pods, backing off while none becomes Ready, until `pending` is empty or
+        `deadline` passes."""
+        delay = READY_POLL_MIN
+        last_report = monotonic()
+        while pending and monotonic() < deadline:
+            before = len(pending)
+            for pod in list_labeled("pod", "mission=tank"):
+                key = (pod.metadata.namespace, pod.metadata.name)
+                if key in pending and self.pod_ready(pod):
+                    pending.discard(key)
+            if pending and monotonic() - last_report >= READY_REPORT_INTERVAL:
+                self.report_pods_ready(pending)
+                last_report = monotonic()
+            if pending:
+                delay = READY_POLL_MIN if len(pending) < before else min(2 * delay, READY_POLL_MAX)
+                sleep(min(delay, max(0, deadline - monotonic())))
+
+    def wait_for_pods_ready(self):
+        """Block until every tank pod reports Ready, following a pod watch and falling back to
+        polling when watching is forbidden or the watch expires. Raises after --ready-timeout."""
+        if sclient is None or self.options.snapshot:
+            return
+        deadline = monotonic() + self.options.ready_timeout
+        pending = {(tank["namespace"], tank["tank"]) for tank in WARNET["tanks"]}
+        try:
+            self.watch_pods_ready(pending, deadline)
+        except client.ApiException as e:
+            # Namespaced players may be allowed to list pods, but not to watch them
+            if e.status != 403:
+                raise
+            self.log.info("Not allowed to watch pods, polling them instead")
+        if pending:
+            self.report_pods_ready(pending)
+            self.poll_pods_ready(pending, deadline)
+        if pending:
+            self.report_pods_ready(pending)
+            raise RuntimeError(
+                f"{len(pending)} tank pod(s) not ready after {self.options.ready_timeout}s"
+            )
+        self.log.info(f"All {len(WARNET['tanks'])} tank pods ready")
+
+    def peers(self, node, max_age=None):
+        """
+        The getpeerinfo of `node` as a PeerSnapshot, shared by every phase that asks for it
+        within `max_age` seconds (default: --peer-ttl). `max_age=0` forces a fresh one.
+        """
+        max_age = self.options.peer_ttl if max_age is None else max_age
+        snapshot = self._peer_snapshots.get(node.index)
+        if snapshot is None or monotonic() - snapshot.taken > max_age:
+            taken = monotonic()
+            snapshot = self._peer_snapshots[node.index] = PeerSnapshot(node.getpeerinfo(), taken)
+        return snapshot
+
+    def invalidate_peers(self, *nodes):
+        """Drop the peer snapshots of `nodes` (of every node if none given), e.g. after changing
+        their connections."""
+        if not nodes:
+            self._peer_snapshots.clear()
+        for node in nodes:
+            self._peer_snapshots.pop(node.index, None)
+
     def wait_for_tanks_connected(self):
-        def tank_connected(self, tank):
-            while True:
-                peers = tank.getpeerinfo()
-                count = sum(
-                    1
-                    for peer in peers
-                    if peer.get("connection_type") == "manual" or peer.get("addnode") is True
+        def tank_connected(tank):
+            try:
+                peers = self.peers(tank, max_age=0)
+            except (OSError, http.client.HTTPException, JSONRPCException):
+                # The node may still be starting up; try again on the next tick
+                return False
+            count = sum(
+                1
+                for peer in peers
+                if peer.get("connection_type") == "manual" or peer.get("addnode") is True
+            )
+            return count >= tank.init_peers
+
+        self.wait_for_pods_ready()
+
+        # A single poller checks every pending tank per tick, backing off while none of them
+        # makes progress, and only reports the aggregate state now and then.
+        pending = list(self.nodes)
+        delay = READY_POLL_MIN
+        last_report = monotonic()
+        with ThreadPoolExecutor(max_workers=min(32, max(1, len(pending)))) as pool:
+            while pending:
+                connected = list(pool.map(tank_connected, pending))
+                progress = any(connected)
+                pending = [tank for tank, ok in zip(pending, connected) if not ok]
+                if pending and monotonic() - last_report >= READY_REPORT_INTERVAL:
+                    waiting = ", ".join(tank.tank for tank in pending[:5])
+                    self.log.info(
+                        f"{len(self.nodes) - len(pending)}/{len(self.nodes)} tanks connected "
+                        f"(waiting on {waiting}{', ...' if len(pending) > 5 else ''})"
+                    )
+                    last_report = monotonic()
+                if pending:
+                    delay = READY_POLL_MIN if progress else min(2 * delay, READY_POLL_MAX)
+                    sleep(delay)
+        # The snapshots above may predate the links warnet opens with addconnection
+        self.invalidate_peers()
+        self.log.info(f"Network connected ({len(self.nodes)} tanks)")
+        if self.options.arrivals and self.observer is None:
+            self.observe()
+
+    def observe(self, nodes=None, fetch_tx=False):
+        """
+        Connect a passive P2P observer to every node in `nodes` (default: every tank) and return
+        its ArrivalLog, which fills with the inv/tx arrivals from them, tagged by node index.
+        """
+        if self.observer is None:
+            self.observer = P2PObserver(fetch_tx=fetch_tx)
+        for node in self.nodes if nodes is None else nodes:
+            if node.index not in self.observer.interfaces:
+                self.observer.connect(
+                    node.index,
+                    node.rpchost,
+                    P2P_PORT,
+                    net=node.chain,
+                    timeout_factor=self.options.timeout_factor,
                 )
-                self.log.info(f"Tank {tank.tank} connected to {count}/{tank.init_peers} peers")
-                if count >= tank.init_peers:
-                    break
-                else:
-                    sleep(1)
-
-        conn_threads = [
-            threading.Thread(target=tank_connected, args=(self, tank)) for tank in self.nodes
-        ]
-        for thread in conn_threads:
-            thread.start()
+        self.observer.wait_for_verack()
+        self.log.info(f"Observing {len(self.observer.interfaces)} tanks over P2P")
+        return self.observer.arrivals
+
+    def dump_rpc_metrics(self):
+        """Write the RPC metrics to --rpc-metrics and log where the harness spent its time."""
+        metrics = AuthServiceProxy.metrics
+        if metrics is None:
+            return
+        host_names = {node.rpchost: node.tank for node in self.nodes}
+        metrics.dump(self.options.rpc_metrics, host_names)
+        totals = sorted(metrics.totals().items(), key=lambda item: item[1][2], reverse=True)
+        busiest = ", ".join(
+            f"{method} {calls} calls/{seconds:.1f}s" + (f"/{errors} errors" if errors else "")
+            for method, (calls, errors, seconds) in totals[:5]
+        )
+        self.log.info(f"RPC metrics written to {self.options.rpc_metrics}; busiest: {busiest}")
 
-        all(thread.join() is None for thread in conn_threads)
-        self.log.info("Network connected")
+    def dump_arrivals(self):
+        """Write the observed arrival timeline to --arrivals."""
+        if self.observer is None or not self.options.arrivals:
+            return
+        arrivals = self.observer.arrivals
+        arrivals.dump(self.options.arrivals, {node.index: node.tank for node in self.nodes})
+        self.log.info(f"{len(arrivals)} P2P arrivals written to {self.options.arrivals}")
+
+    def shutdown(self):
+        self.dump_rpc_metrics()
+        self.dump_arrivals()
+        if self.observer is not None:
+            # Before super().shutdown() stops the network thread the connections live on
+            self.observer.disconnect()
+        return super().shutdown()
 
     def handle_sigterm(self, signum, frame):
         print("SIGTERM received, stopping...")
@@ -168,41 +539,35 @@ class Commander(BitcoinTestFramework):
         ch.setFormatter(formatter)
         self.log.addHandler(ch)
 
-        # Keep a separate index of tanks by pod name
-        self.tanks: dict[str, TestNode] = {}
-        self.lns: dict[str, LND] = {}
-        self.channels = WARNET["channels"]
+        if self.options.arrivals and not self.arrivals_supported:
+            raise RuntimeError(f"--arrivals is not supported by {self.__class__.__name__}")
+        if self.options.rpc_metrics:
+            AuthServiceProxy.metrics = RPCMetrics()
+        AuthServiceProxy.fast_decode = self.options.fast_rpc
 
-        for i, tank in enumerate(WARNET["tanks"]):
-            self.log.info(
-                f"Adding TestNode #{i} from pod {tank['tank']} with IP {tank['rpc_host']}"
-            )
-            node = TestNode(
-                i,
-                pathlib.Path(),  # datadir path
-                chain=tank["chain"],
-                rpchost=tank["rpc_host"],
-                timewait=60,
-                timeout_factor=self.options.timeout_factor,
-                bitcoind=None,
-                bitcoin_cli=None,
-                cwd=self.options.tmpdir,
-                coverage_dir=self.options.coveragedir,
-            )
-            node.tank = tank["tank"]
-            node.rpc = get_rpc_proxy(
-                f"http://{tank['rpc_user']}:{tank['rpc_password']}@{tank['rpc_host']}:{tank['rpc_port']}",
-                i,
-                timeout=60,
-                coveragedir=self.options.coveragedir,
-            )
-            node.rpc_connected = True
-            node.init_peers = int(tank["init_peers"])
+        if self.options.snapshot:
+            warnet = load_snapshot(self.options.snapshot)
+        else:
+            warnet = discover_warnet()
+        if self.options.save_snapshot:
+            save_snapshot(self.options.save_snapshot, warnet)
+        self.log.info(
+            f"Deployment {snapshot_digest(warnet)}: {len(warnet['tanks'])} tanks, "
+            f"{len(warnet['lightning'])} lightning nodes, {len(warnet['channels'])} channels"
+            + (f" (from snapshot {self.options.snapshot})" if self.options.snapshot else "")
+        )
 
-            self.nodes.append(node)
-            self.tanks[tank["tank"]] = node
+        self.nodes = remote_tanks(warnet["tanks"], self.options.coveragedir)
+        self._peer_snapshots: dict[int, PeerSnapshot] = {}
+        self.observer = None
+        # Keep a separate index of tanks by pod name
+        self.tanks: dict[str, RemoteTank] = {node.tank: node for node in self.nodes}
+        self.lns: dict[str, LND] = {}
+        self.channels = warnet["channels"]
+        for node in self.nodes:
+            self.log.debug(f"Added tank #{node.index} {node.tank} with IP {node.rpchost}")
 
-        for ln in WARNET["lightning"]:
+        for ln in warnet["lightning"]:
             self.lns[ln] = LND(ln)
 
         self.num_nodes = len(self.nodes)
@@ -361,6 +726,56 @@ class Commander(BitcoinTestFramework):
             action="store_true",
             help="use BIP324 v2 connections between all nodes by default",
         )
+        parser.add_argument(
+            "--snapshot",
+            dest="snapshot",
+            default=None,
+            help="Start from a deployment snapshot written by --save-snapshot instead of querying "
+            "Kubernetes. Only valid while the deployment (and its pod IPs) is unchanged",
+        )
+        parser.add_argument(
+            "--rpc-metrics",
+            dest="rpc_metrics",
+            default=None,
+            help="Record per-tank, per-method RPC call counts, errors, payload bytes and latency "
+            "histograms, and write them to this file (JSON) on exit",
+        )
+        parser.add_argument(
+            "--ready-timeout",
+            dest="ready_timeout",
+            default=600,
+            type=float,
+            help="Seconds to wait for every tank pod to become Ready (default: 600)",
+        )
+        parser.add_argument(
+            "--peer-ttl",
+            dest="peer_ttl",
+            default=10,
+            type=float,
+            help="Seconds a getpeerinfo snapshot is shared between scenario phases (default: 10)",
+        )
+        parser.add_argument(
+            "--fast-rpc",
+            dest="fast_rpc",
+            default=False,
+            action="store_true",
+            help="Decode the responses of amount-free RPCs (getnetmsgstats, getnettotals, "
+            "getchaintips, ...) with plain floats instead of Decimals",
+        )
+        parser.add_argument(
+            "--arrivals",
+            dest="arrivals",
+            default=None,
+            help="Observe every tank over P2P once the network is connected, and write the "
+            "inv/tx arrival timeline to this file (CSV) on exit. Adds an inbound peer to every "
+            "tank (left out of Commander.peers()); not supported by scenarios measuring bandwidth",
+        )
+        parser.add_argument(
+            "--save-snapshot",
+            dest="save_snapshot",
+            default=None,
+            help="Write the discovered tanks, lightning nodes and channels to this file",
+        )
 
         self.add_options(parser)
         # Running TestShell in a Jupyter notebook causes an additional -f argument
@@ -411,65 +826,74 @@ class Commander(BitcoinTestFramework):
                 since there will be a race between the actual connection and performing
                 the assertions before one node shuts down.
         """
-        from_connection = self.nodes[a]
-        to_connection = self.nodes[b]
-        from_num_peers = 1 + len(from_connection.getpeerinfo())
-        to_num_peers = 1 + len(to_connection.getpeerinfo())
-        ip_port = self.nodes[b].rpchost + ":18444"
+        self.connect_many([(a, b)], peer_advertises_v2=peer_advertises_v2, wait_for_connect=wait_for_connect)
 
+    def connect_many(self, pairs, *, peer_advertises_v2=None, wait_for_connect: bool = True, timeout=60):
+        """
+        Connect every (a, b) pair, a to b, with `addnode onetry`. Nodes are given by index or
+        RemoteTank. The addnodes are issued concurrently, then the handshakes of all pairs are
+        tracked together, from one getpeerinfo per involved node per tick.
+        """
+        pairs = [
+            (self.nodes[a] if isinstance(a, int) else a, self.nodes[b] if isinstance(b, int) else b)
+            for a, b in pairs
+        ]
+        if not pairs:
+            return
         if peer_advertises_v2 is None:
             peer_advertises_v2 = self.options.v2transport
 
-        if peer_advertises_v2:
-            from_connection.addnode(node=ip_port, command="onetry", v2transport=True)
-        else:
-            # skip the optional third argument (default false) for
-            # compatibility with older clients
-            from_connection.addnode(ip_port, "onetry")
-
-        if not wait_for_connect:
-            return
+        def addnode(pair):
+            from_connection, to_connection = pair
+            ip_port = f"{to_connection.rpchost}:{P2P_PORT}"
+            if peer_advertises_v2:
+                from_connection.addnode(node=ip_port, command="onetry", v2transport=True)
+            else:
+                # skip the optional third argument (default false) for
+                # compatibility with older clients
+                from_connection.addnode(ip_port, "onetry")
 
         # poll until version handshake complete to avoid race conditions
         # with transaction relaying
         # See comments in net_processing:
         # * Must have a version message before anything else
         # * Must have a verack message before anything else
-        self.wait_until(
-            lambda: sum(peer["version"] != 0 for peer in from_connection.getpeerinfo())
-            == from_num_peers
-        )
-        self.wait_until(
-            lambda: sum(peer["version"] != 0 for peer in to_connection.getpeerinfo())
-            == to_num_peers
-        )
-        self.wait_until(
-            lambda: sum(
-                peer["bytesrecv_per_msg"].pop("verack", 0) >= 21
-                for peer in from_connection.getpeerinfo()
-            )
-            == from_num_peers
-        )
-        self.wait_until(
-            lambda: sum(
-                peer["bytesrecv_per_msg"].pop("verack", 0) >= 21
-                for peer in to_connection.getpeerinfo()
-            )
-            == to_num_peers
-        )
         # The message bytes are counted before processing the message, so make
         # sure it was fully processed by waiting for a ping.
-        self.wait_until(
-            lambda: sum(
-                peer["bytesrecv_per_msg"].pop("pong", 0) >= 29
-                for peer in from_connection.getpeerinfo()
-            )
-            == from_num_peers
-        )
-        self.wait_until(
-            lambda: sum(
-                peer["bytesrecv_per_msg"].pop("pong", 0) >= 29
-                for peer in to_connection.getpeerinfo()
-            )
-            == to_num_peers
-        )
+        def handshaken(peer):
+            received = peer["bytesrecv_per_msg"]
+            return peer["version"] != 0 and received.get("verack", 0) >= 21 and received.get("pong", 0) >= 29
+
+        def connected(snapshot, host, inbound):
+            return any(peer["inbound"] == inbound and handshaken(peer) for peer in snapshot.by_address(host))
+
+        with ThreadPoolExecutor(max_workers=min(32, len(pairs))) as pool:
+            # list() re-raises the first RPC error, if any
+            list(pool.map(addnode, pairs))
+            self.invalidate_peers(*{node.index: node for pair in pairs for node in pair}.values())
+            if not wait_for_connect:
+                return
+
+            pending = pairs
+            deadline = monotonic() + timeout * self.options.timeout_factor
+            while True:
+                nodes = list({node.index: node for pair in pending for node in pair}.values())
+                snapshot = dict(zip((node.index for node in nodes), pool.map(lambda n: self.peers(n, max_age=0), nodes)))
+                pending = [
+                    (a, b)
+                    for a, b in pending
+                    if not (
+                        connected(snapshot[a.index], b.rpchost, inbound=False)
+                        and connected(snapshot[b.index], a.rpchost, inbound=True)
+                    )
+                ]
+                if not pending:
+                    return
+                if monotonic() > deadline:
+                    waiting = ", ".join(f"{a.tank}->{b.tank}" for a, b in pending[:5])
+                    raise AssertionError(
+                        f"{len(pending)}/{len(pairs)} connection(s) not established after "
+                        f"{timeout * self.options.timeout_factor:g}s: {waiting}"
+                        + (", ..." if len(pending) > 5 else "")
+                    )
+                sleep(CONNECT_POLL_INTERVAL)
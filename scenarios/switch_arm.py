@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Switch a live deployment from one experiment arm to another, without redeploying.
+
+Applies the connection diff computed offline by utils/diff_networks.py: on every tank,
+concurrently, the connections to remove are dropped (`addnode remove` for addnode links, then
+`disconnectnode`) and the new ones opened (`addnode add` / `addconnection`). It then waits until
+every tank's outbound peers match the target arm, e.g.:
+
+  warnet run scenarios/switch_arm.py \\
+      --diff "$(python utils/diff_networks.py networks/eclipse-relay networks/eclipse-recon)"
+"""
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from commander import P2P_PORT, Commander
+
+from test_framework.authproxy import JSONRPCException
+
+
+class SwitchArm(Commander):
+    def set_test_params(self):
+        super().set_test_params()
+        # Overridden by Commander.setup() to the real tank count; required here.
+        self.num_nodes = 1
+
+    def add_options(self, parser):
+        parser.description = "Turn the deployed arm into another one by applying a connection diff over RPC"
+        parser.usage = "warnet run /path/to/switch_arm.py --diff <utils/diff_networks.py output>"
+        parser.add_argument("--diff", dest="diff", default=None,
+                            help="JSON connection diff, as printed by utils/diff_networks.py")
+        parser.add_argument("--timeout", dest="timeout", default=60, type=int,
+                            help="Seconds to wait for every tank to reach its target peer set (default: 60)")
+        parser.add_argument("--jobs", dest="jobs", default=32, type=int,
+                            help="Tanks reconfigured concurrently (default: 32)")
+
+    def p2p_addr(self, tank):
+        return f"{self.tanks[tank].rpchost}:{P2P_PORT}"
+
+    # The (peer tank, connection type) of every outbound connection of a node, from a snapshot at
+    # most `max_age` seconds old (see Commander.peers).
+    def outbound_peers(self, node, max_age=None):
+        return {
+            (self.tank_by_host.get(peer["addr"].rsplit(":", 1)[0]), peer["connection_type"])
+            for peer in self.peers(node, max_age=max_age).outbound
+        }
+
+    def switch_tank(self, tank, removals, additions):
+        node = self.tanks[tank]
+        dropped = set()
+        if removals:
+            snapshot = self.peers(node)
+            for link in removals:
+                if link["type"] == "manual":
+                    # Otherwise the node would reconnect to its added node right away
+                    try:
+                        node.addnode(self.p2p_addr(link["to"]), "remove")
+                    except JSONRPCException as e:
+                        self.log.warning(f"{tank}: addnode remove {link['to']} failed: {e}")
+                for peer in snapshot.by_address(self.tanks[link["to"]].rpchost):
+                    if not peer["inbound"]:
+                        node.disconnectnode("", peer["id"])
+                        dropped.add(peer["id"])
+        if dropped and additions:
+            # disconnectnode only flags the peers: until the node actually drops them, a new
+            # connection to the same address is silently refused as a duplicate
+            self.wait_until(
+                lambda: not dropped & {peer["id"] for peer in self.peers(node, max_age=0)},
+                timeout=self.options.timeout,
+            )
+        for link in additions:
+            if link["type"] == "manual":
+                node.addnode(self.p2p_addr(link["to"]), "add")
+            else:
+                node.addconnection(self.p2p_addr(link["to"]), link["type"], link.get("v2", True))
+        self.invalidate_peers(node)
+
+    def run_test(self):
+        if self.options.diff is None:
+            raise RuntimeError("--diff is required; generate it with utils/diff_networks.py")
+        diff = json.loads(self.options.diff)
+        unknown = set(diff["expect"]) - set(self.tanks)
+        if unknown:
+            raise RuntimeError(f"diff references {len(unknown)} tank(s) not deployed, e.g. {min(unknown)}")
+        self.tank_by_host = {node.rpchost: name for name, node in self.tanks.items()}
+
+        self.log.info("Waiting for all tanks to be connected")
+        self.wait_for_tanks_connected()
+
+        tanks = sorted(set(diff["remove"]) | set(diff["add"]))
+        removals = sum(len(links) for links in diff["remove"].values())
+        additions = sum(len(links) for links in diff["add"].values())
+        self.log.info(f"Switching arm: removing {removals} and adding {additions} connections on {len(tanks)} tanks")
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=self.options.jobs) as pool:
+            # list() re-raises the first RPC error, if any
+            list(pool.map(
+                lambda t: self.switch_tank(t, diff["remove"].get(t, []), diff["add"].get(t, [])),
+                tanks,
+            ))
+        self.log.info(f"Connections updated in {time.time() - start:.1f}s, verifying peer sets")
+
+        expected = {tank: {tuple(link) for link in links} for tank, links in diff["expect"].items()}
+        deadline = time.time() + self.options.timeout
+        pending = set(expected)
+        with ThreadPoolExecutor(max_workers=self.options.jobs) as pool:
+            while pending and time.time() < deadline:
+                actual = dict(zip(pending, pool.map(lambda t: self.outbound_peers(self.tanks[t], max_age=0), pending)))
+                pending = {tank for tank, peers in actual.items() if peers != expected[tank]}
+                if pending:
+                    time.sleep(1)
+
+        if pending:
+            for tank in sorted(pending):
+                peers = self.outbound_peers(self.tanks[tank])
+                self.log.error(f"{tank}: missing {sorted(expected[tank] - peers)}, "
+                               f"unexpected {sorted(peers - expected[tank], key=str)}")
+            raise RuntimeError(f"{len(pending)}/{len(expected)} tank(s) did not reach the target arm "
+                               f"within {self.options.timeout}s")
+        self.log.info(f"Arm switched in {time.time() - start:.1f}s; all {len(expected)} peer sets verified")
+
+
+def main():
+    SwitchArm().main()
+
+
+if __name__ == "__main__":
+    main()
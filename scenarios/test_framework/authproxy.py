@@ -41,11 +41,28 @@ import json
 import logging
 import pathlib
 import socket
+import threading
 import time
 import urllib.parse
 
 HTTP_TIMEOUT = 30
 USER_AGENT = "AuthServiceProxy/0.1"
+# RPCs whose results carry no amounts, so with fast_decode their floats can be plain floats
+# instead of Decimals. getpeerinfo (minfeefilter) and verbose getrawmempool (fees) do not
+# qualify.
+FAST_DECODE_METHODS = frozenset({
+    'getaddednodeinfo',
+    'getbestblockhash',
+    'getblockcount',
+    'getblockhash',
+    'getchaintips',
+    'getconnectioncount',
+    'getnettotals',
+    'getnetmsgstats',
+    'getnodeaddresses',
+    'ping',
+    'uptime',
+})
 
 log = logging.getLogger("BitcoinRPC")
 
@@ -69,9 +86,16 @@ def serialization_fallback(o):
 
 class AuthServiceProxy():
     __id_count = 0
+    # Optional rpc_metrics.RPCMetrics every call is recorded into, keyed by host and method
+    metrics = None
+    # Opt-in: decode FAST_DECODE_METHODS responses straight from bytes, with plain floats
+    fast_decode = False
 
     # ensure_ascii: escape unicode as \uXXXX, passed to json.dumps
     def __init__(self, service_url, service_name=None, timeout=HTTP_TIMEOUT, connection=None, ensure_ascii=True):
+        self.__method_proxies = threading.local()
+        # One keep-alive connection per thread, shared by the method and wallet proxies
+        self.__conns = threading.local()
         self.__service_url = service_url
         self._service_name = service_name
         self.ensure_ascii = ensure_ascii  # can be toggled on the fly by tests
@@ -90,9 +114,30 @@ class AuthServiceProxy():
         if name.startswith('__') and name.endswith('__'):
             # Python internal stuff
             raise AttributeError
-        if self._service_name is not None:
-            name = "%s.%s" % (self._service_name, name)
-        return AuthServiceProxy(self.__service_url, name, connection=self.__conn)
+        # Method proxies are cached per thread, like the connection they use
+        method_proxies = self.__method_proxies.__dict__
+        proxy = method_proxies.get(name)
+        if proxy is None:
+            proxy = method_proxies[name] = self.__method_proxy(name)
+        return proxy
+
+    def __method_proxy(self, name):
+        """A proxy for `name` sharing this one's parsed URL, auth header and connections."""
+        proxy = object.__new__(type(self))
+        proxy.__dict__.update(self.__dict__)
+        proxy.__method_proxies = threading.local()
+        proxy._service_name = name if self._service_name is None else "%s.%s" % (self._service_name, name)
+        proxy.ensure_ascii = True
+        proxy.timeout = self.__conn.timeout
+        return proxy
+
+    @property
+    def __conn(self):
+        conn = getattr(self.__conns, 'conn', None)
+        if conn is None:
+            self._set_conn()
+            conn = self.__conns.conn
+        return conn
 
     def _request(self, method, path, postdata):
         '''
@@ -102,17 +147,25 @@ class AuthServiceProxy():
                    'User-Agent': USER_AGENT,
                    'Authorization': self.__auth_header,
                    'Content-type': 'application/json'}
-        self.__conn.request(method, path, postdata, headers)
-        return self._get_response()
+        try:
+            self.__conn.request(method, path, postdata, headers)
+            return self._get_response()
+        except (BrokenPipeError, ConnectionResetError):
+            # The server closed the kept-alive connection while it was idle (RemoteDisconnected
+            # is a ConnectionResetError too): reconnect and try once more
+            self.__conn.close()
+            self.__conn.request(method, path, postdata, headers)
+            return self._get_response()
 
     def get_request(self, *args, **argsn):
         AuthServiceProxy.__id_count += 1
 
-        log.debug("-{}-> {} {}".format(
-            AuthServiceProxy.__id_count,
-            self._service_name,
-            json.dumps(args or argsn, default=serialization_fallback, ensure_ascii=self.ensure_ascii),
-        ))
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("-{}-> {} {}".format(
+                AuthServiceProxy.__id_count,
+                self._service_name,
+                json.dumps(args or argsn, default=serialization_fallback, ensure_ascii=self.ensure_ascii),
+            ))
         if args and argsn:
             params = dict(args=args, **argsn)
         else:
@@ -122,9 +175,24 @@ class AuthServiceProxy():
                 'params': params,
                 'id': AuthServiceProxy.__id_count}
 
+    def _timed_request(self, rpc_method, postdata):
+        """Do a HTTP request, recording it into `metrics` if enabled."""
+        if self.metrics is None:
+            return self._request('POST', self.__url.path, postdata)
+        self._response_size = 0
+        start = time.perf_counter()
+        failed = True
+        try:
+            response, status = self._request('POST', self.__url.path, postdata)
+            failed = status != HTTPStatus.OK or (isinstance(response, dict) and response.get('error') is not None)
+            return response, status
+        finally:
+            self.metrics.record(self.__url.hostname, rpc_method, time.perf_counter() - start, failed,
+                                len(postdata), self._response_size)
+
     def __call__(self, *args, **argsn):
         postdata = json.dumps(self.get_request(*args, **argsn), default=serialization_fallback, ensure_ascii=self.ensure_ascii)
-        response, status = self._request('POST', self.__url.path, postdata.encode('utf-8'))
+        response, status = self._timed_request(self._service_name, postdata.encode('utf-8'))
         if response['error'] is not None:
             raise JSONRPCException(response['error'], status)
         elif 'result' not in response:
@@ -138,8 +206,9 @@ class AuthServiceProxy():
 
     def batch(self, rpc_call_list):
         postdata = json.dumps(list(rpc_call_list), default=serialization_fallback, ensure_ascii=self.ensure_ascii)
-        log.debug("--> " + postdata)
-        response, status = self._request('POST', self.__url.path, postdata.encode('utf-8'))
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("--> " + postdata)
+        response, status = self._timed_request('batch', postdata.encode('utf-8'))
         if status != HTTPStatus.OK:
             raise JSONRPCException({
                 'code': -342, 'message': 'non-200 HTTP status code but no JSON-RPC error'}, status)
@@ -150,6 +219,8 @@ class AuthServiceProxy():
         try:
             http_response = self.__conn.getresponse()
         except socket.timeout:
+            # The late response would be read as the next request's
+            self.__conn.close()
             raise JSONRPCException({
                 'code': -344,
                 'message': '%r RPC took longer than %f seconds. Consider '
@@ -166,24 +237,32 @@ class AuthServiceProxy():
                 {'code': -342, 'message': 'non-JSON HTTP response with \'%i %s\' from server' % (http_response.status, http_response.reason)},
                 http_response.status)
 
-        responsedata = http_response.read().decode('utf8')
-        response = json.loads(responsedata, parse_float=decimal.Decimal)
-        elapsed = time.time() - req_start_time
-        if "error" in response and response["error"] is None:
-            log.debug("<-%s- [%.6f] %s" % (response["id"], elapsed, json.dumps(response["result"], default=serialization_fallback, ensure_ascii=self.ensure_ascii)))
+        responsedata = http_response.read()
+        self._response_size = len(responsedata)
+        if self.fast_decode and self._service_name in FAST_DECODE_METHODS:
+            response = json.loads(responsedata)
         else:
-            log.debug("<-- [%.6f] %s" % (elapsed, responsedata))
+            response = json.loads(responsedata.decode('utf8'), parse_float=decimal.Decimal)
+        if log.isEnabledFor(logging.DEBUG):
+            elapsed = time.time() - req_start_time
+            if "error" in response and response["error"] is None:
+                log.debug("<-%s- [%.6f] %s" % (response["id"], elapsed, json.dumps(response["result"], default=serialization_fallback, ensure_ascii=self.ensure_ascii)))
+            else:
+                log.debug("<-- [%.6f] %s" % (elapsed, responsedata.decode('utf8')))
         return response, http_response.status
 
     def __truediv__(self, relative_uri):
-        return AuthServiceProxy("{}/{}".format(self.__service_url, relative_uri), self._service_name, connection=self.__conn)
+        proxy = AuthServiceProxy("{}/{}".format(self.__service_url, relative_uri), self._service_name, timeout=self.timeout)
+        # Same host: the per-thread connections can be shared
+        proxy.__conns = self.__conns
+        return proxy
 
     def _set_conn(self, connection=None):
         port = 80 if self.__url.port is None else self.__url.port
         if connection:
-            self.__conn = connection
+            self.__conns.conn = connection
             self.timeout = connection.timeout
         elif self.__url.scheme == 'https':
-            self.__conn = http.client.HTTPSConnection(self.__url.hostname, port, timeout=self.timeout)
+            self.__conns.conn = http.client.HTTPSConnection(self.__url.hostname, port, timeout=self.timeout)
         else:
-            self.__conn = http.client.HTTPConnection(self.__url.hostname, port, timeout=self.timeout)
+            self.__conns.conn = http.client.HTTPConnection(self.__url.hostname, port, timeout=self.timeout)
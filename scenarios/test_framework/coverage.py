@@ -8,12 +8,71 @@ Provides a way to track which RPC commands are exercised during
 testing.
 """
 
+import atexit
 import os
+import threading
+import time
 
 from .authproxy import AuthServiceProxy
 from typing import Optional
 
 REFERENCE_FILENAME = 'rpc_interface.txt'
+# Seconds between flushes of the buffered coverage of a logfile
+COVERAGE_FLUSH_INTERVAL = 30
+
+
+class CoverageRecorder():
+    """
+    Aggregates the RPC methods called for a coverage logfile in memory.
+
+    Methods are appended to the logfile, once per flush, every
+    COVERAGE_FLUSH_INTERVAL seconds and at exit, instead of on every call.
+    There is a single recorder per logfile, safe to use from several threads.
+
+    The logfile therefore holds each method name once per flush in which it
+    was called, rather than one line per call: it tells which methods were
+    exercised, not how often.
+
+    """
+    _recorders = {}
+    _recorders_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, coverage_logfile: str) -> 'CoverageRecorder':
+        recorder = cls._recorders.get(coverage_logfile)
+        if recorder is None:
+            with cls._recorders_lock:
+                recorder = cls._recorders.setdefault(coverage_logfile, cls(coverage_logfile))
+        return recorder
+
+    @classmethod
+    def flush_all(cls):
+        for recorder in list(cls._recorders.values()):
+            recorder.flush()
+
+    def __init__(self, coverage_logfile: str):
+        self.coverage_logfile = coverage_logfile
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._next_flush = time.monotonic() + COVERAGE_FLUSH_INTERVAL
+
+    def record(self, rpc_method: str):
+        with self._lock:
+            self._pending.add(rpc_method)
+            due = time.monotonic() >= self._next_flush
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, set()
+            self._next_flush = time.monotonic() + COVERAGE_FLUSH_INTERVAL
+            if pending:
+                with open(self.coverage_logfile, 'a+', encoding='utf8') as f:
+                    f.writelines("%s\n" % rpc_method for rpc_method in sorted(pending))
+
+
+atexit.register(CoverageRecorder.flush_all)
 
 
 class AuthServiceProxyWrapper():
@@ -26,25 +85,35 @@ class AuthServiceProxyWrapper():
         Kwargs:
             auth_service_proxy_instance: the instance being wrapped.
             rpc_url: url of the RPC instance being wrapped
-            coverage_logfile: if specified, write each service_name
-                out to a file when called.
+            coverage_logfile: if specified, record each service_name
+                called, to be written out to this file (see CoverageRecorder).
 
         """
         self.auth_service_proxy_instance = auth_service_proxy_instance
         self.rpc_url = rpc_url
         self.coverage_logfile = coverage_logfile
+        self.coverage = CoverageRecorder.get(coverage_logfile) if coverage_logfile else None
+        # Per thread, like the method proxies of AuthServiceProxy
+        self._wrappers = threading.local()
 
     def __getattr__(self, name):
+        if name == '_wrappers':
+            raise AttributeError(name)
+        wrappers = self._wrappers.__dict__
+        wrapper = wrappers.get(name)
+        if wrapper is not None:
+            return wrapper
         return_val = getattr(self.auth_service_proxy_instance, name)
         if not isinstance(return_val, type(self.auth_service_proxy_instance)):
             # If proxy getattr returned an unwrapped value, do the same here.
             return return_val
-        return AuthServiceProxyWrapper(return_val, self.rpc_url, self.coverage_logfile)
+        wrapper = wrappers[name] = AuthServiceProxyWrapper(return_val, self.rpc_url, self.coverage_logfile)
+        return wrapper
 
     def __call__(self, *args, **kwargs):
         """
-        Delegates to AuthServiceProxy, then writes the particular RPC method
-        called to a file.
+        Delegates to AuthServiceProxy, then records the particular RPC method
+        called.
 
         """
         return_val = self.auth_service_proxy_instance.__call__(*args, **kwargs)
@@ -52,11 +121,8 @@ class AuthServiceProxyWrapper():
         return return_val
 
     def _log_call(self):
-        rpc_method = self.auth_service_proxy_instance._service_name
-
-        if self.coverage_logfile:
-            with open(self.coverage_logfile, 'a+', encoding='utf8') as f:
-                f.write("%s\n" % rpc_method)
+        if self.coverage is not None:
+            self.coverage.record(self.auth_service_proxy_instance._service_name)
 
     def __truediv__(self, relative_uri):
         return AuthServiceProxyWrapper(self.auth_service_proxy_instance / relative_uri,
@@ -29,7 +29,7 @@ import struct
 import time
 import unittest
 
-from test_framework.siphash import siphash256
+from test_framework.siphash import siphash256, siphash256_many
 from test_framework.util import assert_equal
 
 MAX_LOCATOR_SZ = 101
@@ -46,6 +46,7 @@ SEQUENCE_FINAL = 0xffffffff  # Sequence number that disables nLockTime if set fo
 MAX_PROTOCOL_MESSAGE_LENGTH = 4000000  # Maximum length of incoming protocol messages
 MAX_HEADERS_RESULTS = 2000  # Number of headers sent in one getheaders result
 MAX_INV_SIZE = 50000  # Maximum number of entries in an 'inv' protocol message
+RECON_Q_PRECISION = 32767  # reqtxrcncl carries q scaled by this, as a uint16 (BIP 330)
 
 NODE_NETWORK = (1 << 0)
 NODE_BLOOM = (1 << 2)
@@ -915,6 +916,27 @@ def calculate_shortid(k0, k1, tx_hash):
     expected_shortid &= 0x0000ffffffffffff
     return expected_shortid
 
+# calculate_shortid() for many transaction hashes at once (requires numpy), as
+# a uint64 array
+def calculate_shortids(k0, k1, tx_hashes):
+    return siphash256_many(k0, k1, tx_hashes) & 0x0000ffffffffffff
+
+
+# The BIP 330 (Erlay) short id keys for a pair of sendtxrcncl salts
+def calculate_recon_keys(salt1, salt2):
+    tag = sha256(b"Tx Relay Salting")
+    salt = sha256(tag + tag + struct.pack("<QQ", min(salt1, salt2), max(salt1, salt2)))
+    return list(struct.unpack("<QQ", salt[:16]))
+
+# The BIP 330 (Erlay) short id of a wtxid: the sketch element it reconciles as
+def calculate_recon_shortid(k0, k1, wtx_hash):
+    return (1 + siphash256(k0, k1, wtx_hash)) & 0xffffffff
+
+# calculate_recon_shortid() for many wtxids at once (requires numpy), as a
+# uint64 array that Minisketch.add_many() accepts
+def calculate_recon_shortids(k0, k1, wtx_hashes):
+    return (siphash256_many(k0, k1, wtx_hashes) + 1) & 0xffffffff
+
 
 # This version gets rid of the array lengths, and reinterprets the differential
 # encoding into indices that can be used for lookup.
@@ -1889,6 +1911,88 @@ class msg_sendtxrcncl:
         return "msg_sendtxrcncl(version=%lu, salt=%lu)" %\
             (self.version, self.salt)
 
+class msg_reqtxrcncl:
+    """Reconciliation request: the initiator's set size and its q coefficient
+    (see RECON_Q_PRECISION)."""
+    __slots__ = ("set_size", "q")
+    msgtype = b"reqtxrcncl"
+
+    def __init__(self, set_size=0, q=0):
+        self.set_size = set_size
+        self.q = q
+
+    def deserialize(self, f):
+        self.set_size, self.q = struct.unpack("<HH", f.read(4))
+
+    def serialize(self):
+        return struct.pack("<HH", self.set_size, self.q)
+
+    def __repr__(self):
+        return "msg_reqtxrcncl(set_size=%i, q=%i)" % (self.set_size, self.q)
+
+class msg_sketch:
+    """Serialized minisketch of the responder's (or, as an extension, the
+    initiator's) reconciliation set: 4 bytes per unit of capacity."""
+    __slots__ = ("skdata",)
+    msgtype = b"sketch"
+
+    def __init__(self, skdata=b""):
+        self.skdata = skdata
+
+    def deserialize(self, f):
+        self.skdata = deser_string(f)
+
+    def serialize(self):
+        return ser_string(self.skdata)
+
+    @property
+    def capacity(self):
+        return len(self.skdata) // 4
+
+    def __repr__(self):
+        return "msg_sketch(capacity=%i, skdata=%s)" % (self.capacity, self.skdata.hex())
+
+class msg_reqsketchext:
+    __slots__ = ()
+    msgtype = b"reqsketchext"
+
+    def __init__(self):
+        pass
+
+    def deserialize(self, f):
+        pass
+
+    def serialize(self):
+        return b""
+
+    def __repr__(self):
+        return "msg_reqsketchext()"
+
+class msg_reconcildiff:
+    """Reconciliation outcome: whether the sketch decoded, and the short ids
+    of the transactions the initiator is missing."""
+    __slots__ = ("success", "ask_shortids")
+    msgtype = b"reconcildiff"
+
+    def __init__(self, success=False, ask_shortids=None):
+        self.success = success
+        self.ask_shortids = ask_shortids if ask_shortids is not None else []
+
+    def deserialize(self, f):
+        self.success = struct.unpack("<B", f.read(1))[0] != 0
+        count = deser_compact_size(f)
+        self.ask_shortids = list(struct.unpack("<%dI" % count, f.read(4 * count)))
+
+    def serialize(self):
+        r = b""
+        r += struct.pack("<B", self.success)
+        r += ser_compact_size(len(self.ask_shortids))
+        r += struct.pack("<%dI" % len(self.ask_shortids), *self.ask_shortids)
+        return r
+
+    def __repr__(self):
+        return "msg_reconcildiff(success=%s, ask_shortids=%s)" % (self.success, repr(self.ask_shortids))
+
 class TestFrameworkScript(unittest.TestCase):
     def test_addrv2_encode_decode(self):
         def check_addrv2(ip, net):
@@ -1904,3 +2008,28 @@ class TestFrameworkScript(unittest.TestCase):
         check_addrv2("2bqghnldu6mcug4pikzprwhtjjnsyederctvci6klcwzepnjd46ikjyd.onion", CAddress.NET_TORV3)
         check_addrv2("255fhcp6ajvftnyo7bwz3an3t4a4brhopm3bamyh2iu5r3gnr2rq.b32.i2p", CAddress.NET_I2P)
         check_addrv2("fc32:17ea:e415:c3bf:9808:149d:b5a2:c9aa", CAddress.NET_CJDNS)
+
+    def test_erlay_encode_decode(self):
+        def check_roundtrip(msg, ser):
+            self.assertEqual(msg.serialize(), ser)
+            actual = type(msg)()
+            actual.deserialize(BytesIO(ser))
+            self.assertEqual(actual.serialize(), ser)
+
+        check_roundtrip(msg_reqtxrcncl(1000, int(0.25 * RECON_Q_PRECISION)), bytes.fromhex("e803ff1f"))
+        check_roundtrip(msg_sketch(bytes(range(8))), bytes.fromhex("080001020304050607"))
+        check_roundtrip(msg_reqsketchext(), b"")
+        check_roundtrip(msg_reconcildiff(True, [1, 0xdeadbeef]), bytes.fromhex("010201000000efbeadde"))
+
+    def test_shortids(self):
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            self.skipTest("numpy is not available")
+        rng = random.Random(1)
+        k0, k1 = calculate_recon_keys(rng.getrandbits(64), rng.getrandbits(64))
+        hashes = [rng.getrandbits(256) for _ in range(100)]
+        self.assertEqual(list(calculate_shortids(k0, k1, hashes)),
+                         [calculate_shortid(k0, k1, h) for h in hashes])
+        self.assertEqual(list(calculate_recon_shortids(k0, k1, hashes)),
+                         [calculate_recon_shortid(k0, k1, h) for h in hashes])
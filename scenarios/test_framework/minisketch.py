@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""Minisketch over GF(2^32), as used by Erlay (BIP 330) for transaction reconciliation.
+
+A sketch of capacity c holds the odd power sums s1, s3, ..., s(2c-1) of the 32-bit elements
+(short transaction ids) added to it, and serializes them as c little-endian 32-bit words: the
+format of the `sketch` P2P message. Merging two sketches (xor) gives the sketch of the
+symmetric difference of their sets, which decode() recovers as long as it has at most c
+elements: Berlekamp-Massey finds the polynomial whose roots are the elements, and they are then
+found by Berlekamp trace splitting.
+
+add_many() inserts NumPy arrays of elements with vectorized field arithmetic, when NumPy is
+available.
+"""
+
+import random
+import struct
+import unittest
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FIELD_BITS = 32
+FIELD_MASK = (1 << FIELD_BITS) - 1
+# GF(2^32) = GF(2)[x] / (x^32 + x^7 + x^3 + x^2 + 1), minisketch's field: gf_mul() and
+# gf_mul_array() reduce by that modulus
+
+
+def gf_mul(a, b):
+    # Carry-less product, four bits of b at a time
+    a2, a4, a8 = a << 1, a << 2, a << 3
+    t = (0, a, a2, a2 ^ a, a4, a4 ^ a, a4 ^ a2, a4 ^ a2 ^ a,
+         a8, a8 ^ a, a8 ^ a2, a8 ^ a2 ^ a, a8 ^ a4, a8 ^ a4 ^ a, a8 ^ a4 ^ a2, a8 ^ a4 ^ a2 ^ a)
+    r = (t[b & 15] ^ t[b >> 4 & 15] << 4 ^ t[b >> 8 & 15] << 8 ^ t[b >> 12 & 15] << 12
+         ^ t[b >> 16 & 15] << 16 ^ t[b >> 20 & 15] << 20 ^ t[b >> 24 & 15] << 24 ^ t[b >> 28] << 28)
+    # Reduce: x^32 = x^7 + x^3 + x^2 + 1, folding the bits that the taps push back over x^32
+    high = r >> FIELD_BITS
+    high ^= high >> 25 ^ high >> 29 ^ high >> 30
+    return (r ^ high ^ high << 2 ^ high << 3 ^ high << 7) & FIELD_MASK
+
+
+def gf_inv(a):
+    """a^(2^32 - 2), the inverse of a non-zero element."""
+    assert a, "zero has no inverse"
+    r = 1
+    for _ in range(FIELD_BITS - 1):
+        a = gf_mul(a, a)
+        r = gf_mul(r, a)
+    return r
+
+
+# Polynomials over the field: coefficient lists, lowest degree first, without trailing zeros.
+
+def poly_trim(p):
+    while p and not p[-1]:
+        p.pop()
+    return p
+
+
+def poly_monic(p):
+    inv = gf_inv(p[-1])
+    return [gf_mul(c, inv) for c in p]
+
+
+def poly_mod(a, m):
+    """a mod m, for a monic m."""
+    a = list(a)
+    dm = len(m) - 1
+    for i in range(len(a) - 1, dm - 1, -1):
+        c = a[i]
+        if c:
+            for j in range(dm):
+                if m[j]:
+                    a[i - dm + j] ^= gf_mul(c, m[j])
+            a[i] = 0
+    return poly_trim(a[:dm])
+
+
+def poly_sqrmod(a, m):
+    # Squaring is linear in characteristic 2: only the coefficients need squaring
+    r = [0] * (2 * len(a) - 1) if a else []
+    for i, c in enumerate(a):
+        r[2 * i] = gf_mul(c, c)
+    return poly_mod(r, m)
+
+
+def poly_gcd(a, b):
+    a, b = poly_trim(list(a)), poly_trim(list(b))
+    while b:
+        a, b = b, poly_mod(a, poly_monic(b))
+    return poly_monic(a) if a else a
+
+
+def poly_divide(a, m):
+    """a / m, for a monic m dividing a."""
+    a = list(a)
+    dm = len(m) - 1
+    q = [0] * (len(a) - dm)
+    for i in range(len(a) - 1, dm - 1, -1):
+        c = a[i]
+        q[i - dm] = c
+        if c:
+            for j in range(dm + 1):
+                a[i - dm + j] ^= gf_mul(c, m[j])
+    return q
+
+
+def berlekamp_massey(syndromes):
+    """The shortest LFSR (connection polynomial, constant term 1) generating `syndromes`."""
+    current, previous = [1], [1]
+    length, shift, last_discrepancy = 0, 1, 1
+    for n, syndrome in enumerate(syndromes):
+        discrepancy = syndrome
+        for i in range(1, min(length, len(current) - 1) + 1):
+            discrepancy ^= gf_mul(current[i], syndromes[n - i])
+        if not discrepancy:
+            shift += 1
+            continue
+        coef = gf_mul(discrepancy, gf_inv(last_discrepancy))
+        updated = current + [0] * max(0, len(previous) + shift - len(current))
+        for i, c in enumerate(previous):
+            updated[i + shift] ^= gf_mul(coef, c)
+        if 2 * length <= n:
+            previous, last_discrepancy = current, discrepancy
+            length, shift = n + 1 - length, 1
+        else:
+            shift += 1
+        current = updated
+    return (current + [0] * (length + 1))[:length + 1]
+
+
+def find_roots(poly, rng):
+    """The roots of a monic polynomial, if it has deg(poly) distinct roots in the field;
+    None otherwise."""
+    degree = len(poly) - 1
+    if degree == 0:
+        return []
+    if degree == 1:
+        return [poly[0]]
+    # Splits into distinct linear factors iff it divides x^(2^32) - x
+    x_pow = [0, 1]
+    for _ in range(FIELD_BITS):
+        x_pow = poly_sqrmod(x_pow, poly)
+    if x_pow != [0, 1]:
+        return None
+    return _split_roots(poly, rng)
+
+
+def _split_roots(poly, rng):
+    degree = len(poly) - 1
+    if degree == 1:
+        return [poly[0]]
+    # Tr(a*x) = sum((a*x)^(2^i)) mod poly is 0 on about half of the roots: gcd splits them off
+    while True:
+        a = rng.getrandbits(FIELD_BITS) or 1
+        term = poly_mod([0, a], poly)
+        trace = list(term)
+        for _ in range(FIELD_BITS - 1):
+            term = poly_sqrmod(term, poly)
+            trace = trace + [0] * (len(term) - len(trace))
+            for i, c in enumerate(term):
+                trace[i] ^= c
+        factor = poly_gcd(poly, poly_trim(trace))
+        if 0 < len(factor) - 1 < degree:
+            quotient = poly_divide(poly, factor)
+            return _split_roots(factor, rng) + _split_roots(quotient, rng)
+
+
+if np is not None:
+    def gf_mul_array(a, b):
+        """Element-wise field product of two uint64 arrays of field elements."""
+        r = np.zeros_like(a)
+        for i in range(FIELD_BITS):
+            r ^= (a << np.uint64(i)) * ((b >> np.uint64(i)) & np.uint64(1))
+        high = r >> np.uint64(FIELD_BITS)
+        high ^= (high >> np.uint64(25)) ^ (high >> np.uint64(29)) ^ (high >> np.uint64(30))
+        r ^= high ^ (high << np.uint64(2)) ^ (high << np.uint64(3)) ^ (high << np.uint64(7))
+        return r & np.uint64(FIELD_MASK)
+
+
+class Minisketch:
+    """A sketch of up to `capacity` differences between sets of non-zero 32-bit elements."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        # Odd power sums s1, s3, ..., s(2c-1)
+        self.odd_sums = [0] * capacity
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Deserialize a sketch, e.g. the payload of a `sketch` message."""
+        sketch = cls(len(data) // 4)
+        sketch.odd_sums = list(struct.unpack("<%dI" % sketch.capacity, data[:4 * sketch.capacity]))
+        return sketch
+
+    def serialize(self):
+        return struct.pack("<%dI" % self.capacity, *self.odd_sums)
+
+    def add(self, element):
+        """Add (or, if already present, remove) an element. 0 is ignored, as in minisketch."""
+        element &= FIELD_MASK
+        if not element:
+            return
+        square = gf_mul(element, element)
+        power = element
+        for i in range(self.capacity):
+            self.odd_sums[i] ^= power
+            power = gf_mul(power, square)
+
+    def add_many(self, elements):
+        """Add many elements at once, vectorized with NumPy when available."""
+        if np is None:
+            for element in elements:
+                self.add(int(element))
+            return
+        elements = np.asarray(elements, dtype=np.uint64) & np.uint64(FIELD_MASK)
+        elements = elements[elements != 0]
+        if not elements.size:
+            return
+        square = gf_mul_array(elements, elements)
+        power = elements
+        for i in range(self.capacity):
+            self.odd_sums[i] ^= int(np.bitwise_xor.reduce(power))
+            power = gf_mul_array(power, square)
+
+    def merge(self, other):
+        """Turn this sketch into the sketch of the symmetric difference with `other`. The result
+        has the smaller of both capacities."""
+        self.capacity = min(self.capacity, other.capacity)
+        self.odd_sums = [a ^ b for a, b in zip(self.odd_sums, other.odd_sums)]
+        return self
+
+    def decode(self, max_count=None, seed=0):
+        """The elements of the sketched set (difference), or None if it has more than
+        `max_count` (default: capacity) elements and can't be decoded."""
+        max_count = self.capacity if max_count is None else min(max_count, self.capacity)
+        # Even power sums follow from the odd ones: s(2k) = s(k)^2
+        sums = [0] * (2 * self.capacity)
+        for k in range(1, 2 * self.capacity + 1):
+            sums[k - 1] = self.odd_sums[k // 2] if k % 2 else gf_mul(sums[k // 2 - 1], sums[k // 2 - 1])
+        connection = berlekamp_massey(sums)
+        count = len(connection) - 1
+        if count > max_count or not connection[-1]:
+            return None
+        # The reversed connection polynomial has the elements as its roots
+        roots = find_roots(connection[::-1], random.Random(seed))
+        if roots is None or len(set(roots)) != count:
+            return None
+        return sorted(roots)
+
+
+class TestFrameworkMinisketch(unittest.TestCase):
+    def test_field(self):
+        # x^31 * x = x^32 = x^7 + x^3 + x^2 + 1
+        self.assertEqual(gf_mul(1 << 31, 2), 0x8d)
+        rng = random.Random(1)
+        for _ in range(20):
+            a = rng.getrandbits(FIELD_BITS) or 1
+            self.assertEqual(gf_mul(a, gf_inv(a)), 1)
+
+    def test_roundtrip(self):
+        rng = random.Random(2)
+        for capacity in (1, 2, 5, 20):
+            for count in range(capacity + 1):
+                shared = [rng.getrandbits(FIELD_BITS) | 1 for _ in range(10)]
+                ours = [rng.getrandbits(FIELD_BITS) | 1 for _ in range(count // 2)]
+                theirs = [rng.getrandbits(FIELD_BITS) | 1 for _ in range(count - count // 2)]
+                a, b = Minisketch(capacity), Minisketch(capacity)
+                for element in shared + ours:
+                    a.add(element)
+                for element in shared + theirs:
+                    b.add(element)
+                self.assertEqual(a.merge(b).decode(), sorted(ours + theirs))
+
+    def test_overfull(self):
+        rng = random.Random(3)
+        # Overfull sketches are only detected with high probability: a capacity-c sketch of
+        # more elements decodes to garbage about once in c! tries
+        for capacity in (8, 12):
+            for count in (capacity + 1, 2 * capacity):
+                sketch = Minisketch(capacity)
+                for _ in range(count):
+                    sketch.add(rng.getrandbits(FIELD_BITS) | 1)
+                self.assertIsNone(sketch.decode())
+        sketch = Minisketch(8)
+        for element in range(1, 6):
+            sketch.add(element)
+        self.assertIsNone(sketch.decode(max_count=4))
+        self.assertEqual(sketch.decode(max_count=5), [1, 2, 3, 4, 5])
+
+    def test_add_many(self):
+        rng = random.Random(4)
+        elements = [rng.getrandbits(FIELD_BITS) for _ in range(50)] + [0]
+        one_by_one, batched = Minisketch(8), Minisketch(8)
+        for element in elements:
+            one_by_one.add(element)
+        batched.add_many(elements)
+        self.assertEqual(batched.odd_sums, one_by_one.odd_sums)
+
+    def test_serialize(self):
+        rng = random.Random(5)
+        sketch = Minisketch(6)
+        for _ in range(4):
+            sketch.add(rng.getrandbits(FIELD_BITS))
+        data = sketch.serialize()
+        self.assertEqual(len(data), 4 * 6)
+        copy = Minisketch.from_bytes(data)
+        self.assertEqual(copy.capacity, 6)
+        self.assertEqual(copy.odd_sums, sketch.odd_sums)
+        self.assertEqual(copy.serialize(), data)
@@ -22,14 +22,17 @@ P2PTxInvStore: A p2p interface class that inherits from P2PDataStore, and keeps
 
 import asyncio
 from collections import defaultdict
-from io import BytesIO
 import logging
+import random
 import struct
 import sys
 import threading
+import unittest
 
 from test_framework.messages import (
     CBlockHeader,
+    CInv,
+    CTransaction,
     MAX_HEADERS_RESULTS,
     msg_addr,
     msg_addrv2,
@@ -59,10 +62,14 @@ from test_framework.messages import (
     msg_notfound,
     msg_ping,
     msg_pong,
+    msg_reconcildiff,
+    msg_reqsketchext,
+    msg_reqtxrcncl,
     msg_sendaddrv2,
     msg_sendcmpct,
     msg_sendheaders,
     msg_sendtxrcncl,
+    msg_sketch,
     msg_tx,
     MSG_TX,
     MSG_TYPE_MASK,
@@ -75,6 +82,7 @@ from test_framework.messages import (
     sha256,
 )
 from test_framework.util import (
+    FIXED_POLL,
     MAX_NODES,
     p2p_port,
     wait_until_helper_internal,
@@ -130,10 +138,14 @@ MESSAGEMAP = {
     b"notfound": msg_notfound,
     b"ping": msg_ping,
     b"pong": msg_pong,
+    b"reconcildiff": msg_reconcildiff,
+    b"reqsketchext": msg_reqsketchext,
+    b"reqtxrcncl": msg_reqtxrcncl,
     b"sendaddrv2": msg_sendaddrv2,
     b"sendcmpct": msg_sendcmpct,
     b"sendheaders": msg_sendheaders,
     b"sendtxrcncl": msg_sendtxrcncl,
+    b"sketch": msg_sketch,
     b"tx": msg_tx,
     b"verack": msg_verack,
     b"version": msg_version,
@@ -148,6 +160,27 @@ MAGIC_BYTES = {
 }
 
 
+# Magic bytes, message type, payload length and checksum
+MSG_HEADER_SIZE = 4 + 12 + 4 + 4
+
+
+class MessageReader:
+    """Read-only file-like object over a memoryview, to deserialize message payloads from.
+
+    Unlike BytesIO, it doesn't copy the payload: only what deserialize() reads is copied."""
+    __slots__ = ("_view", "_pos")
+
+    def __init__(self, view):
+        self._view = view
+        self._pos = 0
+
+    def read(self, n=-1):
+        start = self._pos
+        end = len(self._view) if n is None or n < 0 else min(start + n, len(self._view))
+        self._pos = end
+        return self._view[start:end].tobytes()
+
+
 class P2PConnection(asyncio.Protocol):
     """A low-level connection object to a node's P2P interface.
 
@@ -161,6 +194,10 @@ class P2PConnection(asyncio.Protocol):
     This class contains no logic for handing the P2P message payloads. It must be
     sub-classed and the on_message() callback overridden."""
 
+    # Message types (bytes) to deserialize and pass to on_message(), or None for all. Others
+    # are only read up to their header and passed to on_ignored_message().
+    message_types = None
+
     def __init__(self):
         # The underlying transport of the connection.
         # Should only call methods on this from the NetworkThread, c.f. call_soon_threadsafe
@@ -177,8 +214,10 @@ class P2PConnection(asyncio.Protocol):
         self.dstport = dstport
         # The initial message to send after the connection was made:
         self.on_connection_send_msg = None
-        self.recvbuf = b""
+        self.recvbuf = bytearray()
         self.magic_bytes = MAGIC_BYTES[net]
+        # Bytes received per message type, headers included, as in getpeerinfo
+        self.bytesrecv_per_msg = defaultdict(int)
 
     def peer_connect(self, dstaddr, dstport, *, net, timeout_factor):
         self.peer_connect_helper(dstaddr, dstport, net, timeout_factor)
@@ -217,7 +256,7 @@ class P2PConnection(asyncio.Protocol):
         else:
             logger.debug("Closed connection to: %s:%d" % (self.dstaddr, self.dstport))
         self._transport = None
-        self.recvbuf = b""
+        self.recvbuf = bytearray()
         self.on_close()
 
     # Socket read methods
@@ -225,6 +264,7 @@ class P2PConnection(asyncio.Protocol):
     def data_received(self, t):
         """asyncio callback when data is read from the socket."""
         if len(t) > 0:
+            # Extends the bytearray in place
             self.recvbuf += t
             self._on_data()
 
@@ -235,39 +275,61 @@ class P2PConnection(asyncio.Protocol):
         parses and verifies the P2P header, then passes the P2P payload to
         the on_message callback for processing."""
         try:
-            while True:
-                if len(self.recvbuf) < 4:
-                    return
-                if self.recvbuf[:4] != self.magic_bytes:
-                    raise ValueError("magic bytes mismatch: {} != {}".format(repr(self.magic_bytes), repr(self.recvbuf)))
-                if len(self.recvbuf) < 4 + 12 + 4 + 4:
-                    return
-                msgtype = self.recvbuf[4:4+12].split(b"\x00", 1)[0]
-                msglen = struct.unpack("<i", self.recvbuf[4+12:4+12+4])[0]
-                checksum = self.recvbuf[4+12+4:4+12+4+4]
-                if len(self.recvbuf) < 4 + 12 + 4 + 4 + msglen:
-                    return
-                msg = self.recvbuf[4+12+4+4:4+12+4+4+msglen]
-                th = sha256(msg)
-                h = sha256(th)
-                if checksum != h[:4]:
-                    raise ValueError("got bad checksum " + repr(self.recvbuf))
-                self.recvbuf = self.recvbuf[4+12+4+4+msglen:]
-                if msgtype not in MESSAGEMAP:
-                    raise ValueError("Received unknown msgtype from %s:%d: '%s' %s" % (self.dstaddr, self.dstport, msgtype, repr(msg)))
-                f = BytesIO(msg)
-                t = MESSAGEMAP[msgtype]()
-                t.deserialize(f)
-                self._log_message("receive", t)
-                self.on_message(t)
+            with memoryview(self.recvbuf) as view:
+                consumed = self._read_messages(view)
+            # Drop the processed messages once per read, instead of copying the
+            # rest of the buffer after every message
+            del self.recvbuf[:consumed]
         except Exception as e:
             logger.exception('Error reading message:', repr(e))
             raise
 
+    def _read_messages(self, view):
+        """Process every complete message in `view`; returns the bytes consumed.
+
+        Payloads are parsed in place: no memoryview into the buffer outlives this call, so
+        the buffer can be resized afterwards."""
+        offset = 0
+        while True:
+            available = len(view) - offset
+            if available < 4:
+                return offset
+            if view[offset:offset+4] != self.magic_bytes:
+                raise ValueError("magic bytes mismatch: {} != {}".format(repr(self.magic_bytes), repr(bytes(view[offset:]))))
+            if available < MSG_HEADER_SIZE:
+                return offset
+            msgtype = view[offset+4:offset+4+12].tobytes().split(b"\x00", 1)[0]
+            msglen = struct.unpack_from("<i", view, offset+4+12)[0]
+            checksum = view[offset+4+12+4:offset+MSG_HEADER_SIZE]
+            if available < MSG_HEADER_SIZE + msglen:
+                return offset
+            self.bytesrecv_per_msg[msgtype.decode('ascii')] += MSG_HEADER_SIZE + msglen
+            if self.message_types is not None and msgtype not in self.message_types:
+                # Not even checksummed
+                offset += MSG_HEADER_SIZE + msglen
+                self.on_ignored_message(msgtype, msglen)
+                continue
+            msg = view[offset+MSG_HEADER_SIZE:offset+MSG_HEADER_SIZE+msglen]
+            th = sha256(msg)
+            h = sha256(th)
+            if checksum != h[:4]:
+                raise ValueError("got bad checksum " + repr(bytes(view[offset:])))
+            offset += MSG_HEADER_SIZE + msglen
+            if msgtype not in MESSAGEMAP:
+                raise ValueError("Received unknown msgtype from %s:%d: '%s' %s" % (self.dstaddr, self.dstport, msgtype, repr(msg.tobytes())))
+            t = MESSAGEMAP[msgtype]()
+            t.deserialize(MessageReader(msg))
+            self._log_message("receive", t)
+            self.on_message(t)
+
     def on_message(self, message):
         """Callback for processing a P2P payload. Must be overridden by derived class."""
         raise NotImplementedError
 
+    def on_ignored_message(self, msgtype, msglen):
+        """Callback for a message not in message_types, of `msglen` payload bytes."""
+        pass
+
     # Socket write methods
 
     def send_message(self, message):
@@ -309,6 +371,8 @@ class P2PConnection(asyncio.Protocol):
 
     def _log_message(self, direction, msg):
         """Logs a message being sent or received over the connection."""
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
         if direction == "send":
             log_message = "Send message to "
         elif direction == "receive":
@@ -327,9 +391,16 @@ class P2PInterface(P2PConnection):
     node over P2P.
 
     Individual testcases should subclass this and override the on_* methods
-    if they want to alter message handling behaviour."""
+    if they want to alter message handling behaviour. Subclasses only interested
+    in a few message types should list them in message_types: the others are
+    then only counted, from their header, in message_count and bytesrecv_per_msg."""
+    # Always deserialized, to complete the handshake, answer pings and sync_with_ping()
+    CONTROL_MESSAGES = frozenset({b"version", b"verack", b"ping", b"pong"})
+
     def __init__(self, support_addrv2=False, wtxidrelay=True):
         super().__init__()
+        if self.message_types is not None:
+            self.message_types = frozenset(self.message_types) | self.CONTROL_MESSAGES
 
         # Track number of messages of each type received.
         # Should be read-only in a test.
@@ -395,6 +466,10 @@ class P2PInterface(P2PConnection):
                 print("ERROR delivering %s (%s)" % (repr(message), sys.exc_info()[0]))
                 raise
 
+    def on_ignored_message(self, msgtype, msglen):
+        with p2p_lock:
+            self.message_count[msgtype.decode('ascii')] += 1
+
     # Callback methods. Can be overridden by subclasses in individual test
     # cases to provide custom message handling behaviour.
 
@@ -426,10 +501,14 @@ class P2PInterface(P2PConnection):
     def on_merkleblock(self, message): pass
     def on_notfound(self, message): pass
     def on_pong(self, message): pass
+    def on_reconcildiff(self, message): pass
+    def on_reqsketchext(self, message): pass
+    def on_reqtxrcncl(self, message): pass
     def on_sendaddrv2(self, message): pass
     def on_sendcmpct(self, message): pass
     def on_sendheaders(self, message): pass
     def on_sendtxrcncl(self, message): pass
+    def on_sketch(self, message): pass
     def on_tx(self, message): pass
     def on_wtxidrelay(self, message): pass
 
@@ -466,7 +545,7 @@ class P2PInterface(P2PConnection):
                 assert self.is_connected
             return test_function_in()
 
-        wait_until_helper_internal(test_function, timeout=timeout, lock=p2p_lock, timeout_factor=self.timeout_factor)
+        wait_until_helper_internal(test_function, timeout=timeout, lock=p2p_lock, timeout_factor=self.timeout_factor, poll=FIXED_POLL)
 
     def wait_for_connect(self, timeout=60):
         test_function = lambda: self.is_connected
@@ -602,7 +681,7 @@ class NetworkThread(threading.Thread):
     def close(self, timeout=10):
         """Close the connections and network event loop."""
         self.network_event_loop.call_soon_threadsafe(self.network_event_loop.stop)
-        wait_until_helper_internal(lambda: not self.network_event_loop.is_running(), timeout=timeout)
+        wait_until_helper_internal(lambda: not self.network_event_loop.is_running(), timeout=timeout, poll=FIXED_POLL)
         self.network_event_loop.close()
         self.join(timeout)
         # Safe to remove event loop.
@@ -805,3 +884,38 @@ class P2PTxInvStore(P2PInterface):
         self.wait_until(lambda: set(self.tx_invs_received.keys()) == set([int(tx, 16) for tx in txns]), timeout=timeout)
         # Flush messages and wait for the getdatas to be processed
         self.sync_with_ping()
+
+
+class TestFrameworkP2P(unittest.TestCase):
+    def test_framing(self):
+        class Recorder(P2PConnection):
+            def on_message(self, message):
+                self.received.append(message.serialize())
+
+        tx = CTransaction()
+        tx.nVersion = 2
+        messages = [msg_verack(), msg_ping(1), msg_inv([CInv(MSG_TX, 0xabcd)]), msg_tx(tx),
+                    msg_inv([CInv(MSG_TX, i) for i in range(40)]), msg_pong(1)] * 5
+        conn = Recorder()
+        conn.peer_connect_helper('0', 0, "regtest", 1)
+        stream = b"".join(conn.build_message(message) for message in messages)
+        expected = [message.serialize() for message in messages]
+        first = len(conn.build_message(messages[0]))
+
+        rng = random.Random(1)
+        splits = [
+            [1] * len(stream),
+            # A partial header: the chunk boundaries fall inside the second message's header
+            [first + 3, 8, 9, len(stream)],
+        ] + [[rng.randint(1, 2 * MSG_HEADER_SIZE) for _ in range(len(stream))] for _ in range(20)]
+        for sizes in splits:
+            conn.peer_connect_helper('0', 0, "regtest", 1)
+            conn.received = []
+            offset = 0
+            for size in sizes:
+                if offset >= len(stream):
+                    break
+                conn.data_received(stream[offset:offset + size])
+                offset += size
+            self.assertEqual(conn.received, expected)
+            self.assertEqual(len(conn.recvbuf), 0)
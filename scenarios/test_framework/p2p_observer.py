@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""Passive P2P observers: network-wide inv/tx arrival timelines.
+
+A P2PObserver opens one inbound P2P connection to every node, on the shared NetworkThread,
+and appends the local arrival time of every inv entry and tx it receives to an ArrivalLog.
+The log keeps compact columns (arrays, plus one bytearray of 32-byte hashes), so that a
+whole experiment fits in a few bytes per announcement. Nothing depends on
+node-side instrumentation, so it works against unpatched images too.
+
+Observers are inbound peers of the nodes: announcements to them are subject to the nodes'
+inbound trickling, so the timeline is a slightly late view of when each node learnt about
+a transaction. Observers do not negotiate reconciliation (sendtxrcncl): nodes announce
+everything to them by inv, and they never see sketches. They identify themselves with the
+OBSERVER_SUBVERSION user agent, so that peer listings can leave them out.
+"""
+
+from array import array
+import time
+
+from test_framework.messages import (
+    MSG_BLOCK,
+    MSG_TX,
+    MSG_TYPE_MASK,
+    MSG_WTX,
+    NODE_WITNESS,
+    msg_getdata,
+)
+from test_framework.p2p import P2PInterface, p2p_lock
+
+ARRIVAL_INV_TX = 1
+ARRIVAL_INV_BLOCK = 2
+ARRIVAL_TX = 3
+ARRIVAL_KINDS = {
+    ARRIVAL_INV_TX: "inv_tx",
+    ARRIVAL_INV_BLOCK: "inv_block",
+    ARRIVAL_TX: "tx",
+}
+NO_HASH = bytes(32)
+OBSERVER_SUBVERSION = "/warnet-observer:0.1/"
+
+
+class ArrivalLog():
+    """Append-only arrival records: time, source node, kind and (little-endian) hash.
+
+    Appended to from the network thread under p2p_lock; the readers below take it too."""
+
+    def __init__(self):
+        self.times = array('d')
+        self.sources = array('H')
+        self.kinds = array('B')
+        self.hashes = bytearray()
+
+    def __len__(self):
+        return len(self.times)
+
+    def record(self, when, source, kind, hash_bytes=NO_HASH):
+        self.times.append(when)
+        self.sources.append(source)
+        self.kinds.append(kind)
+        self.hashes += hash_bytes
+
+    def hash(self, i):
+        return int.from_bytes(self.hashes[32 * i:32 * (i + 1)], 'little')
+
+    def first_seen(self, kind=ARRIVAL_INV_TX):
+        """{hash: {source: first arrival time}} of every record of `kind`."""
+        first = {}
+        with p2p_lock:
+            for i in range(len(self.times)):
+                if self.kinds[i] != kind:
+                    continue
+                per_source = first.setdefault(self.hash(i), {})
+                source = self.sources[i]
+                if source not in per_source or self.times[i] < per_source[source]:
+                    per_source[source] = self.times[i]
+        return first
+
+    def spread(self, txhash, kind=ARRIVAL_INV_TX):
+        """Seconds between the first and last node to see `txhash`, and how many saw it."""
+        times = self.first_seen(kind).get(txhash, {}).values()
+        if not times:
+            return None, 0
+        return max(times) - min(times), len(times)
+
+    def dump(self, path, source_names=None):
+        """Write the records as CSV: time, source, kind, hash (hex, as in RPCs)."""
+        source_names = source_names or {}
+        with p2p_lock, open(path, 'w', encoding='utf8') as f:
+            f.write("time,source,kind,hash\n")
+            for i in range(len(self.times)):
+                source = self.sources[i]
+                f.write("%.6f,%s,%s,%064x\n" % (self.times[i], source_names.get(source, source),
+                                                ARRIVAL_KINDS[self.kinds[i]], self.hash(i)))
+
+
+class ObserverInterface(P2PInterface):
+    """Records inv/tx arrivals from one node into a shared ArrivalLog. Every other
+    message is only counted. Announced transactions are only requested when `fetch_tx` is
+    set, so that by default the observer never takes part in relay."""
+
+    message_types = frozenset({b"inv", b"tx"})
+
+    def __init__(self, source, arrivals, fetch_tx=False):
+        super().__init__()
+        self.source = source
+        self.arrivals = arrivals
+        self.fetch_tx = fetch_tx
+
+    def peer_connect_send_version(self, services):
+        super().peer_connect_send_version(services)
+        self.on_connection_send_msg.strSubVer = OBSERVER_SUBVERSION
+
+    def on_inv(self, message):
+        now = time.time()
+        want = msg_getdata()
+        for i in message.inv:
+            inv_type = i.type & MSG_TYPE_MASK
+            if inv_type in (MSG_TX, MSG_WTX):
+                self.arrivals.record(now, self.source, ARRIVAL_INV_TX, i.hash.to_bytes(32, 'little'))
+                if self.fetch_tx:
+                    want.inv.append(i)
+            elif inv_type == MSG_BLOCK:
+                self.arrivals.record(now, self.source, ARRIVAL_INV_BLOCK, i.hash.to_bytes(32, 'little'))
+        if want.inv:
+            self.send_message(want)
+
+    def on_tx(self, message):
+        wtxid = message.tx.calc_sha256(with_witness=True)
+        self.arrivals.record(time.time(), self.source, ARRIVAL_TX, wtxid.to_bytes(32, 'little'))
+
+
+class P2PObserver():
+    """One ObserverInterface per node, all recording into `arrivals`."""
+
+    def __init__(self, fetch_tx=False):
+        self.arrivals = ArrivalLog()
+        self.fetch_tx = fetch_tx
+        self.interfaces = {}
+
+    def connect(self, source, dstaddr, dstport, *, net, timeout_factor):
+        """Start connecting to a node, whose records are tagged `source`. Returns the
+        interface, see wait_for_verack()."""
+        assert source not in self.interfaces
+        p2p = ObserverInterface(source, self.arrivals, self.fetch_tx)
+        # Without NODE_NETWORK, so that nodes don't try to sync blocks from the observer
+        p2p.peer_connect(dstaddr, dstport, net=net, timeout_factor=timeout_factor, services=NODE_WITNESS)()
+        self.interfaces[source] = p2p
+        return p2p
+
+    def wait_for_verack(self, timeout=60):
+        for p2p in self.interfaces.values():
+            p2p.wait_for_verack(timeout=timeout)
+
+    def disconnect(self):
+        for p2p in self.interfaces.values():
+            p2p.peer_disconnect()
+        for p2p in self.interfaces.values():
+            p2p.wait_for_disconnect()
+        self.interfaces.clear()
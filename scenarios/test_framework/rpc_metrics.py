@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""Low-overhead RPC call metrics.
+
+Records, per (host, method), the number of calls, errors, request/response payload bytes
+and a latency histogram. Histograms are HDR-style: values are bucketed with a fixed relative
+precision into a fixed-size array, so memory does not grow with the number of calls.
+
+Enable it by setting `AuthServiceProxy.metrics = RPCMetrics()`; every proxy then records
+into it.
+"""
+
+from array import array
+import json
+import random
+import threading
+import unittest
+
+# 2**SUB_BUCKET_BITS linear sub-buckets per power of two: ~6% worst-case relative error
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+HALF_BUCKETS = SUB_BUCKETS // 2
+# Latencies are recorded in microseconds, up to 2**MAX_VALUE_BITS (~9.5 days)
+MAX_VALUE_BITS = 40
+
+
+class LatencyHistogram():
+    """Fixed-memory log-linear histogram of microsecond latencies."""
+    __slots__ = ("counts", "max_value")
+
+    def __init__(self):
+        self.counts = array('I', bytes(4 * (SUB_BUCKETS + (MAX_VALUE_BITS - SUB_BUCKET_BITS) * HALF_BUCKETS)))
+        self.max_value = 0
+
+    @staticmethod
+    def bucket(value):
+        if value < SUB_BUCKETS:
+            return value
+        shift = min(value.bit_length(), MAX_VALUE_BITS) - SUB_BUCKET_BITS
+        return SUB_BUCKETS + (shift - 1) * HALF_BUCKETS + (min(value >> shift, SUB_BUCKETS - 1) - HALF_BUCKETS)
+
+    @staticmethod
+    def bucket_value(index):
+        """Highest value that falls into bucket `index`."""
+        if index < SUB_BUCKETS:
+            return index
+        shift, offset = divmod(index - SUB_BUCKETS, HALF_BUCKETS)
+        return ((HALF_BUCKETS + offset + 1) << (shift + 1)) - 1
+
+    def record(self, value):
+        self.counts[self.bucket(value)] += 1
+        if value > self.max_value:
+            self.max_value = value
+
+    def percentile(self, p):
+        total = sum(self.counts)
+        if not total:
+            return None
+        threshold = p / 100 * total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= threshold:
+                return min(self.bucket_value(index), self.max_value)
+        return self.max_value
+
+
+class MethodStats():
+    __slots__ = ("calls", "errors", "sent_bytes", "recv_bytes", "total_us", "latency")
+
+    def __init__(self):
+        self.calls = self.errors = self.sent_bytes = self.recv_bytes = self.total_us = 0
+        self.latency = LatencyHistogram()
+
+
+class RPCMetrics():
+    """Thread-safe per (host, method) RPC metrics recorder."""
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, host, method, elapsed, error, sent_bytes, recv_bytes):
+        """Record one call that took `elapsed` seconds."""
+        elapsed_us = int(elapsed * 1_000_000)
+        key = (host, method)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = MethodStats()
+            stats.calls += 1
+            stats.errors += bool(error)
+            stats.sent_bytes += sent_bytes
+            stats.recv_bytes += recv_bytes
+            stats.total_us += elapsed_us
+            stats.latency.record(elapsed_us)
+
+    def summary(self, host_names=None):
+        """Nested {host: {method: stats}} dict; `host_names` maps hosts to friendlier names."""
+        host_names = host_names or {}
+        result = {}
+        with self._lock:
+            for (host, method), stats in sorted(self._stats.items(), key=lambda item: str(item[0])):
+                ms = {p: stats.latency.percentile(p) / 1000 for p in (50, 90, 99)}
+                result.setdefault(host_names.get(host, host), {})[method] = {
+                    "calls": stats.calls,
+                    "errors": stats.errors,
+                    "sent_bytes": stats.sent_bytes,
+                    "recv_bytes": stats.recv_bytes,
+                    "total_s": stats.total_us / 1_000_000,
+                    "p50_ms": ms[50],
+                    "p90_ms": ms[90],
+                    "p99_ms": ms[99],
+                    "max_ms": stats.latency.max_value / 1000,
+                }
+        return result
+
+    def totals(self):
+        """Calls, errors and seconds spent per method, across all hosts."""
+        totals = {}
+        with self._lock:
+            for (_, method), stats in self._stats.items():
+                calls, errors, seconds = totals.get(method, (0, 0, 0.0))
+                totals[method] = (calls + stats.calls, errors + stats.errors, seconds + stats.total_us / 1_000_000)
+        return totals
+
+    def dump(self, path, host_names=None):
+        with open(path, 'w', encoding='utf8') as f:
+            json.dump(self.summary(host_names), f, indent=2)
+
+
+class TestFrameworkRPCMetrics(unittest.TestCase):
+    def test_bucket_boundaries(self):
+        size = len(LatencyHistogram().counts)
+        # Small values get a bucket each, then every power of two gets HALF_BUCKETS
+        for value in range(SUB_BUCKETS):
+            self.assertEqual(LatencyHistogram.bucket(value), value)
+        self.assertEqual(LatencyHistogram.bucket(SUB_BUCKETS), SUB_BUCKETS)
+        self.assertEqual(LatencyHistogram.bucket(2 * SUB_BUCKETS), SUB_BUCKETS + HALF_BUCKETS)
+        self.assertEqual(LatencyHistogram.bucket((1 << MAX_VALUE_BITS) - 1), size - 1)
+        # Values past the range are clamped into the last bucket
+        self.assertEqual(LatencyHistogram.bucket(1 << (MAX_VALUE_BITS + 5)), size - 1)
+        previous = 0
+        for value in range(1, 1 << 16):
+            index = LatencyHistogram.bucket(value)
+            self.assertIn(index, (previous, previous + 1))
+            if index != previous:
+                # The previous bucket ends right before this one starts
+                self.assertEqual(LatencyHistogram.bucket_value(previous), value - 1)
+            previous = index
+
+    def test_bucket_value(self):
+        rng = random.Random(1)
+        for _ in range(10000):
+            value = rng.getrandbits(rng.randrange(1, MAX_VALUE_BITS))
+            top = LatencyHistogram.bucket_value(LatencyHistogram.bucket(value))
+            self.assertGreaterEqual(top, value)
+            self.assertLessEqual(top - value, value / HALF_BUCKETS)
+
+    def test_percentile(self):
+        histogram = LatencyHistogram()
+        self.assertIsNone(histogram.percentile(50))
+        for value in range(1, 10001):
+            histogram.record(value)
+        for p, exact in ((50, 5000), (99, 9900)):
+            self.assertGreaterEqual(histogram.percentile(p), exact)
+            self.assertLessEqual(histogram.percentile(p), exact * (1 + 1 / HALF_BUCKETS))
+        self.assertEqual(histogram.percentile(100), 10000)
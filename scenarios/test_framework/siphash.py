@@ -6,8 +6,16 @@
 
 This implements SipHash-2-4. For convenience, an interface taking 256-bit
 integers is provided in addition to the one accepting generic data.
+
+siphash256_many() hashes many 256-bit integers under the same key at once,
+vectorized with NumPy (required for it only).
 """
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 def rotl64(n, b):
     return n >> (64 - b) | (n & ((1 << (64 - b)) - 1)) << b
 
@@ -63,3 +71,56 @@ def siphash(k0, k1, data):
 def siphash256(k0, k1, num):
     assert type(num) is int
     return siphash(k0, k1, num.to_bytes(32, 'little'))
+
+
+def uint256_words(nums):
+    """Pack 256-bit integers (or 32-byte little-endian strings) into an (n, 4)
+    uint64 array of their little-endian 64-bit words."""
+    data = b"".join(num if type(num) is bytes else num.to_bytes(32, 'little') for num in nums)
+    assert len(data) % 32 == 0
+    return np.frombuffer(data, dtype='<u8').reshape(-1, 4).astype(np.uint64)
+
+
+def _rotl64_array(v, b):
+    return (v << np.uint64(b)) | (v >> np.uint64(64 - b))
+
+
+def _siphash_round_array(v0, v1, v2, v3):
+    # Same as siphash_round(); uint64 arrays wrap around on their own
+    v0 += v1
+    v1 = _rotl64_array(v1, 13)
+    v1 ^= v0
+    v0 = _rotl64_array(v0, 32)
+    v2 += v3
+    v3 = _rotl64_array(v3, 16)
+    v3 ^= v2
+    v0 += v3
+    v3 = _rotl64_array(v3, 21)
+    v3 ^= v0
+    v2 += v1
+    v1 = _rotl64_array(v1, 17)
+    v1 ^= v2
+    v2 = _rotl64_array(v2, 32)
+    return (v0, v1, v2, v3)
+
+
+def siphash256_many(k0, k1, nums):
+    """siphash256() of every 256-bit integer in `nums` (or row of a
+    uint256_words() array), as a uint64 array."""
+    words = nums if isinstance(nums, np.ndarray) else uint256_words(nums)
+    n = words.shape[0]
+    v0 = np.full(n, 0x736f6d6570736575 ^ k0, dtype=np.uint64)
+    v1 = np.full(n, 0x646f72616e646f6d ^ k1, dtype=np.uint64)
+    v2 = np.full(n, 0x6c7967656e657261 ^ k0, dtype=np.uint64)
+    v3 = np.full(n, 0x7465646279746573 ^ k1, dtype=np.uint64)
+    # Four full 8-byte blocks, then the final block holding only the length
+    blocks = [words[:, i] for i in range(4)] + [np.uint64(32 << 56)]
+    for t in blocks:
+        v3 ^= t
+        v0, v1, v2, v3 = _siphash_round_array(v0, v1, v2, v3)
+        v0, v1, v2, v3 = _siphash_round_array(v0, v1, v2, v3)
+        v0 ^= t
+    v2 ^= np.uint64(0xff)
+    for _ in range(4):
+        v0, v1, v2, v3 = _siphash_round_array(v0, v1, v2, v3)
+    return v0 ^ v1 ^ v2 ^ v3
@@ -19,6 +19,8 @@ import sys
 import tempfile
 import time
 
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 from .address import create_deterministic_address_bcrt1_p2tr_op_true
 from .authproxy import JSONRPCException
@@ -32,6 +34,7 @@ from .util import (
     check_json_precision,
     get_datadir_path,
     initialize_datadir,
+    mempool_digest,
     p2p_port,
     wait_until_helper_internal,
 )
@@ -42,6 +45,9 @@ class TestStatus(Enum):
     FAILED = 2
     SKIPPED = 3
 
+# Nodes sync_blocks()/sync_mempools() query concurrently
+SYNC_QUERY_JOBS = 32
+
 TEST_EXIT_PASSED = 0
 TEST_EXIT_FAILED = 1
 TEST_EXIT_SKIPPED = 77
@@ -707,17 +713,17 @@ class BitcoinTestFramework(metaclass=BitcoinTestMetaClass):
         rpc_connections = nodes or self.nodes
         timeout = int(timeout * self.options.timeout_factor)
         stop_time = time.time() + timeout
-        while time.time() <= stop_time:
-            best_hash = [x.getbestblockhash() for x in rpc_connections]
-            if best_hash.count(best_hash[0]) == len(rpc_connections):
-                return
-            # Check that each peer has at least one connection
-            assert (all([len(x.getpeerinfo()) for x in rpc_connections]))
-            time.sleep(wait)
-        raise AssertionError("Block sync timed out after {}s:{}".format(
-            timeout,
-            "".join("\n  {!r}".format(b) for b in best_hash),
-        ))
+        with ThreadPoolExecutor(max_workers=min(SYNC_QUERY_JOBS, len(rpc_connections))) as pool:
+            while time.time() <= stop_time:
+                best_hash = list(pool.map(lambda x: x.getbestblockhash(), rpc_connections))
+                if best_hash.count(best_hash[0]) == len(rpc_connections):
+                    return
+                time.sleep(wait)
+            raise AssertionError("Block sync timed out after {}s:{}{}".format(
+                timeout,
+                "".join("\n  {!r} on {} node(s)".format(b, n) for b, n in Counter(best_hash).most_common()),
+                self._sync_peer_report(pool, rpc_connections),
+            ))
 
     def sync_mempools(self, nodes=None, wait=1, timeout=60, flush_scheduler=True):
         """
@@ -727,27 +733,37 @@ class BitcoinTestFramework(metaclass=BitcoinTestMetaClass):
         rpc_connections = nodes or self.nodes
         timeout = int(timeout * self.options.timeout_factor)
         stop_time = time.time() + timeout
-        while time.time() <= stop_time:
-            pool = [set(r.getrawmempool()) for r in rpc_connections]
-            if pool.count(pool[0]) == len(rpc_connections):
-                if flush_scheduler:
-                    for r in rpc_connections:
-                        r.syncwithvalidationinterfacequeue()
-                return
-            # Check that each peer has at least one connection
-            assert (all([len(x.getpeerinfo()) for x in rpc_connections]))
-            time.sleep(wait)
-        raise AssertionError("Mempool sync timed out after {}s:{}".format(
-            timeout,
-            "".join("\n  {!r}".format(m) for m in pool),
-        ))
+        with ThreadPoolExecutor(max_workers=min(SYNC_QUERY_JOBS, len(rpc_connections))) as pool:
+            while time.time() <= stop_time:
+                # Compare order-independent digests instead of full sets
+                pool_digest = list(pool.map(lambda r: mempool_digest(r.getrawmempool()), rpc_connections))
+                if pool_digest.count(pool_digest[0]) == len(rpc_connections):
+                    if flush_scheduler:
+                        list(pool.map(lambda r: r.syncwithvalidationinterfacequeue(), rpc_connections))
+                    return
+                time.sleep(wait)
+            raise AssertionError("Mempool sync timed out after {}s:{}{}".format(
+                timeout,
+                "".join("\n  {} txs (digest {:064x}) on {} node(s)".format(size, digest, n)
+                        for (size, digest), n in Counter(pool_digest).most_common()),
+                self._sync_peer_report(pool, rpc_connections),
+            ))
+
+    @staticmethod
+    def _sync_peer_report(pool, rpc_connections):
+        """Name the nodes without any connection, the usual reason a sync times out."""
+        peer_counts = pool.map(lambda x: len(x.getpeerinfo()), rpc_connections)
+        isolated = [getattr(x, 'index', i) for i, (x, count) in enumerate(zip(rpc_connections, peer_counts)) if not count]
+        if not isolated:
+            return ""
+        return "\n  node(s) without any connection: {}".format(", ".join(map(str, isolated)))
 
     def sync_all(self, nodes=None):
         self.sync_blocks(nodes)
         self.sync_mempools(nodes)
 
-    def wait_until(self, test_function, timeout=60):
-        return wait_until_helper_internal(test_function, timeout=timeout, timeout_factor=self.options.timeout_factor)
+    def wait_until(self, test_function, timeout=60, poll=None):
+        return wait_until_helper_internal(test_function, timeout=timeout, timeout_factor=self.options.timeout_factor, poll=poll)
 
     # Private helper methods. These should not be accessed by the subclass test scripts.
 
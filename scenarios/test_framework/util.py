@@ -241,9 +241,39 @@ def satoshi_round(amount):
     return Decimal(amount).quantize(Decimal('0.00000001'), rounding=ROUND_DOWN)
 
 
-def wait_until_helper_internal(predicate, *, attempts=float('inf'), timeout=float('inf'), lock=None, timeout_factor=1.0):
+class PollBackoff:
+    """Spacing of the predicate checks of wait_until_helper_internal().
+
+    The first check is immediate; the delays after it start at `initial` seconds and grow by
+    `factor` up to `ceiling`, so short waits stay responsive while long waits (where the
+    predicate is usually an RPC) don't hammer the nodes. Each delay is randomized by up to
+    +/-`jitter` (a fraction), so concurrent waiters don't poll in lockstep.
+    """
+    def __init__(self, initial=0.05, *, factor=1.5, ceiling=1.0, jitter=0.0):
+        assert 0 < initial <= ceiling and factor >= 1 and 0 <= jitter < 1
+        self.initial = initial
+        self.factor = factor
+        self.ceiling = ceiling
+        self.jitter = jitter
+
+    def delays(self):
+        delay = self.initial
+        while True:
+            yield delay * random.uniform(1 - self.jitter, 1 + self.jitter) if self.jitter else delay
+            delay = min(delay * self.factor, self.ceiling)
+
+
+# Used by wait_until_helper_internal() unless told otherwise
+DEFAULT_POLL = PollBackoff()
+# The historical fixed 0.05s, for predicates that only check local state (e.g. P2PInterface)
+FIXED_POLL = PollBackoff(0.05, factor=1, ceiling=0.05)
+
+
+def wait_until_helper_internal(predicate, *, attempts=float('inf'), timeout=float('inf'), lock=None, timeout_factor=1.0, poll=None):
     """Sleep until the predicate resolves to be True.
 
+    `poll` is the PollBackoff spacing the checks (default: DEFAULT_POLL).
+
     Warning: Note that this method is not recommended to be used in tests as it is
     not aware of the context of the test framework. Using the `wait_until()` members
     from `BitcoinTestFramework` or `P2PInterface` class ensures the timeout is
@@ -254,29 +284,38 @@ def wait_until_helper_internal(predicate, *, attempts=float('inf'), timeout=floa
         timeout = 60
     timeout = timeout * timeout_factor
     attempt = 0
-    time_end = time.time() + timeout
+    time_start = time.time()
+    time_end = time_start + timeout
+    delays = (poll or DEFAULT_POLL).delays()
 
     while attempt < attempts and time.time() < time_end:
         if lock:
             with lock:
-                if predicate():
-                    return
+                done = predicate()
         else:
-            if predicate():
-                return
+            done = predicate()
+        if done:
+            if attempt:
+                logger.debug("wait_until() predicate true after {} checks in {:.2f}s".format(attempt + 1, time.time() - time_start))
+            return
         attempt += 1
-        time.sleep(0.05)
+        time.sleep(max(0, min(next(delays), time_end - time.time())))
 
     # Print the cause of the timeout
     predicate_source = "''''\n" + inspect.getsource(predicate) + "'''"
-    logger.error("wait_until() failed. Predicate: {}".format(predicate_source))
+    logger.error("wait_until() failed after {} checks. Predicate: {}".format(attempt, predicate_source))
     if attempt >= attempts:
         raise AssertionError("Predicate {} not true after {} attempts".format(predicate_source, attempts))
     elif time.time() >= time_end:
-        raise AssertionError("Predicate {} not true after {} seconds".format(predicate_source, timeout))
+        raise AssertionError("Predicate {} not true after {} seconds ({} checks)".format(predicate_source, timeout, attempt))
     raise RuntimeError('Unreachable')
 
 
+def mempool_digest(txids):
+    """Order-independent digest of a set of txids: their count and their sum modulo 2**256."""
+    return len(txids), sum(int(txid, 16) for txid in txids) & ((1 << 256) - 1)
+
+
 def sha256sum_file(filename):
     h = hashlib.sha256()
     with open(filename, 'rb') as f:
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""Offline topology analytics for warnet network.yaml files.
+
+Pre-screens experiment arms before spending cluster time on them. For every network
+given (a network.yaml or a directory holding one), and treating connections as
+undirected (invs flow both ways once a link is up), it reports:
+
+  hops       : hop-distance distribution from `--sources` sampled source nodes, i.e. the
+               expected number of relay hops a transaction needs to reach every node
+  redundancy : how many neighbours hand each node the same inv on the first wave (all of
+               them one hop closer to the source), and how many shortest paths exist
+  betweenness: (sampled) betweenness centrality of the reachable nodes, those accepting
+               inbound connections, which carry the bulk of the relay
+
+BFS runs over a sparse adjacency matrix for all sampled sources at once, so a 10k-node
+graph takes well under a second.
+
+  python utils/analyze_network.py networks/conn-redundancy-{control,relay,recon}
+"""
+
+import argparse
+import json
+import sys
+from random import Random
+
+import numpy as np
+import scipy.sparse as sp
+
+import create_network
+
+
+def adjacency_matrix(graph, fanout_only=False):
+    """Symmetric CSR adjacency matrix of `graph`, optionally without its reconciliation links."""
+    edges = [
+        (u, v)
+        for u, v, conn_type in graph.edges(data="type")
+        if not (fanout_only and conn_type == create_network.RECON_CONNECTION_TYPE)
+    ]
+    size = graph.number_of_nodes()
+    if not edges:
+        return sp.csr_matrix((size, size))
+    rows, cols = np.array(edges).T
+    adj = sp.coo_matrix(
+        (np.ones(2 * len(edges)), (np.concatenate([rows, cols]), np.concatenate([cols, rows]))),
+        shape=(size, size),
+    ).tocsr()
+    # Collapse mirrored or duplicated entries into a single link
+    adj.data[:] = 1.0
+    return adj
+
+
+def multi_source_bfs(adj, sources):
+    """Run one BFS per source, all at once, as sparse matrix products level by level.
+
+    Returns three (nodes x sources) arrays: `dist` (hops, -1 when unreachable), `sigma` (number
+    of shortest paths) and `announcers` (neighbours at distance `dist - 1`, i.e. the peers that
+    deliver the inv to the node on the first wave)."""
+    size, k = adj.shape[0], len(sources)
+    cols = np.arange(k)
+    dist = np.full((size, k), -1, dtype=np.int32)
+    sigma = np.zeros((size, k))
+    announcers = np.zeros((size, k), dtype=np.int32)
+    dist[sources, cols] = 0
+    sigma[sources, cols] = 1.0
+
+    frontier = sigma.copy()
+    level = 0
+    while frontier.any():
+        level += 1
+        paths = adj @ frontier
+        new = (paths > 0) & (dist < 0)
+        dist[new] = level
+        sigma[new] = paths[new]
+        announcers[new] = (adj @ (frontier > 0).astype(np.float64))[new]
+        frontier = np.where(new, paths, 0.0)
+    return dist, sigma, announcers
+
+
+def sampled_betweenness(adj, sources, dist, sigma):
+    """Brandes' dependency accumulation over the BFS levels of `multi_source_bfs`.
+
+    Normalized as networkx's undirected `betweenness_centrality` (with `k=len(sources)`)."""
+    size, k = dist.shape
+    delta = np.zeros((size, k))
+    safe_sigma = np.where(sigma > 0, sigma, 1.0)
+    for level in range(dist.max(), 0, -1):
+        coeff = np.where(dist == level, (1.0 + delta) / safe_sigma, 0.0)
+        delta += np.where(dist == level - 1, sigma * (adj @ coeff), 0.0)
+    delta[sources, np.arange(k)] = 0.0
+    scale = size / k / ((size - 1) * (size - 2)) if size > 2 else 0.0
+    return delta.sum(axis=1) * scale
+
+
+def analyze(graph, sources, fanout_only=False):
+    """Compute the hop, redundancy and betweenness summaries of a single network."""
+    adj = adjacency_matrix(graph, fanout_only)
+    dist, sigma, announcers = multi_source_bfs(adj, sources)
+
+    # Exclude the sources themselves and whatever they cannot reach
+    reached = dist > 0
+    unreachable = int((dist < 0).sum())
+    hops = dist[reached]
+    reachable = [n for n in graph.nodes if graph.in_degree(n) > 0]
+    betweenness = sampled_betweenness(adj, sources, dist, sigma)
+    top = sorted(reachable, key=lambda n: betweenness[n], reverse=True)
+
+    link_types = {}
+    for _, _, conn_type in graph.edges(data="type"):
+        link_types[conn_type] = link_types.get(conn_type, 0) + 1
+
+    return {
+        "nodes": graph.number_of_nodes(),
+        "links": link_types,
+        "sources": len(sources),
+        "unreachable_pairs": unreachable,
+        "hops": {
+            "histogram": {int(h): int(c) for h, c in zip(*np.unique(hops, return_counts=True))},
+            "mean": float(hops.mean()) if hops.size else None,
+            "max": int(hops.max()) if hops.size else None,
+        },
+        "redundancy": {
+            "announcers_mean": float(announcers[reached].mean()) if hops.size else None,
+            "announcers_max": int(announcers[reached].max()) if hops.size else None,
+            "shortest_paths_median": float(np.median(sigma[reached])) if hops.size else None,
+        },
+        "betweenness": {
+            "min": float(betweenness[reachable].min()) if reachable else None,
+            "median": float(np.median(betweenness[reachable])) if reachable else None,
+            "max": float(betweenness[reachable].max()) if reachable else None,
+            "top": [
+                {"name": graph.nodes[n]["name"], "betweenness": float(betweenness[n])}
+                for n in top[:5]
+            ],
+        },
+    }
+
+
+def format_report(path, report):
+    links = ", ".join(f"{count} {conn_type}" for conn_type, count in report["links"].items())
+    hops, red, bc = report["hops"], report["redundancy"], report["betweenness"]
+    histogram = " ".join(f"{h}:{c}" for h, c in hops["histogram"].items())
+    lines = [
+        f"{path}: {report['nodes']} nodes ({links}), {report['sources']} sampled sources",
+        f"  hops        : mean={hops['mean']:.2f} max={hops['max']}  [{histogram}]",
+        f"  redundancy  : first-wave announcers mean={red['announcers_mean']:.2f} "
+        f"max={red['announcers_max']}, shortest paths median={red['shortest_paths_median']:.0f}",
+        f"  betweenness : reachable min={bc['min']:.4f} median={bc['median']:.4f} max={bc['max']:.4f} "
+        f"(top: {', '.join(t['name'] for t in bc['top'])})",
+    ]
+    if report["unreachable_pairs"]:
+        lines.append(f"  WARNING     : {report['unreachable_pairs']} (source, node) pairs unreachable")
+    return "\n".join(lines)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "networks", nargs="+", help="network.yaml files, or network directories containing one"
+    )
+    parser.add_argument(
+        "-k",
+        "--sources",
+        type=int,
+        default=64,
+        help="Number of sampled source nodes; all nodes if larger than the network (default: 64)",
+    )
+    parser.add_argument(
+        "--fanout-only",
+        action="store_true",
+        help=f"Ignore {create_network.RECON_CONNECTION_TYPE} links, i.e. only consider fanout relay",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=None, help="RNG seed for reproducible source sampling"
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="Print the raw reports as JSON instead of a summary"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.sources <= 0:
+        sys.exit("error: --sources must be > 0")
+
+    reports = {}
+    for path in args.networks:
+        try:
+            graph = create_network.load_network(path)
+        except (OSError, ValueError) as e:
+            sys.exit(f"error: {path}: {e}")
+        size = graph.number_of_nodes()
+        rng = Random(args.seed)
+        sources = sorted(rng.sample(range(size), min(args.sources, size)))
+        reports[path] = analyze(graph, sources, args.fanout_only)
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        print("\n\n".join(format_report(path, report) for path, report in reports.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,10 +6,17 @@ Connection model (mirrors real Bitcoin reachability):
   * Every node opens ``outbound`` connections, always toward reachable nodes.
   * The union of all connections is treated as a simple undirected graph:
     no self-loops, no duplicate edges, and no mirrored edges (A->B && B->A)
+
+Link model (optional, see --latency, --regions and --bandwidth):
+  * Every connection gets a one-way latency and a rate, drawn from the given distributions
+    (or, with --regions, from the latency between the regions its endpoints live in).
+  * They are written to a companion links.yaml (next to the network file by default) for a
+    traffic-shaping stage to apply to each tank; the topology itself is unaffected.
 """
 
 import argparse
 import math
+import pathlib
 import sys
 from random import Random
 
@@ -20,6 +27,18 @@ import yaml
 # addconnection_init scenario. warnet applies this default when `type` is omitted
 # from an entry, so we only omit `type` when it equals this value.
 DEFAULT_CONNECTION_TYPE = "outbound-full-relay"
+# Connection type of Erlay links, which announce transactions via reconciliation instead of fanout.
+RECON_CONNECTION_TYPE = "outbound-full-recon"
+
+# Share of nodes per region, and rough one-way WAN latency between regions (ms), for --regions.
+REGION_WEIGHTS = {"na": 0.35, "eu": 0.40, "asia": 0.15, "sa": 0.05, "oc": 0.05}
+REGION_LATENCY_MS = {
+    ("na", "na"): 20, ("na", "eu"): 45, ("na", "asia"): 80, ("na", "sa"): 60, ("na", "oc"): 90,
+    ("eu", "eu"): 15, ("eu", "asia"): 100, ("eu", "sa"): 100, ("eu", "oc"): 140,
+    ("asia", "asia"): 35, ("asia", "sa"): 150, ("asia", "oc"): 60,
+    ("sa", "sa"): 25, ("sa", "oc"): 160,
+    ("oc", "oc"): 15,
+}
 
 
 class InfeasibleNetwork(Exception):
@@ -140,17 +159,24 @@ def build_network(
     )
 
 
-def to_network_yaml(graph, size, connection_type, v2=True):
+def to_network_yaml(graph, size, connection_type, v2=True, node_ids=None):
     """Render the graph as the warnet network.yaml structure.
 
     `addnode` tags only need the tank name, and create manual connections at node deployment time.
     `addconnection` tags can create other types of connections (e.g. blocks-only, reconciliation),
     and are specified as objects {to: tank-name, type: type}. type is omitted when it equals
-    `DEFAULT_CONNECTION_TYPE`."""
+    `DEFAULT_CONNECTION_TYPE`.
+
+    If `node_ids` is given, only those nodes, and the connections among them, are rendered."""
+    if node_ids is None:
+        node_ids = range(size)
+    included = set(node_ids)
     nodes = []
-    for node_id in range(size):
+    for node_id in node_ids:
         addnode, addconnection = [], []
         for _, target, is_manual in graph.out_edges(node_id, data="manual"):
+            if target not in included:
+                continue
             tank_name = f"tank-{target:04d}"
             if is_manual:
                 addnode.append(tank_name)
@@ -173,6 +199,200 @@ def to_network_yaml(graph, size, connection_type, v2=True):
     }
 
 
+def partition_graph(graph, shards, slack=0.05, passes=8):
+    """Split the nodes into `shards` balanced parts with few connections between them.
+
+    Nodes are streamed in BFS order and greedily placed (Linear Deterministic Greedy) in the
+    shard holding most of their already placed neighbours, damped by how full it is (the last
+    ones topping up any shard still short of its share). Then a few refinement passes move
+    nodes to the shard most of their neighbours are in, as long as that strictly reduces the
+    cut and keeps every shard within `slack` of an even split.
+    Returns the shard index of every node."""
+    size = graph.number_of_nodes()
+    capacity = math.ceil(size / shards * (1 + slack))
+    floor = math.floor(size / shards * (1 - slack))
+    undirected = graph.to_undirected(as_view=True)
+    shard_of = [-1] * size
+    load = [0] * shards
+
+    def neighbours_per_shard(node_id):
+        counts = [0] * shards
+        for peer in undirected.neighbors(node_id):
+            if shard_of[peer] >= 0:
+                counts[shard_of[peer]] += 1
+        return counts
+
+    order = [
+        n
+        for component in nx.connected_components(undirected)
+        for n in nx.bfs_tree(undirected, min(component))
+    ]
+    for placed, node_id in enumerate(order):
+        counts = neighbours_per_shard(node_id)
+        # Once the nodes left are only enough to bring every shard up to `floor`, they go to
+        # the shards still below it
+        deficit = sum(max(0, floor - load[s]) for s in range(shards))
+        underfull = size - placed <= deficit
+        # Ties (e.g. no placed neighbours yet) go to the emptiest shard
+        best = max(
+            (s for s in range(shards) if load[s] < (floor if underfull else capacity)),
+            key=lambda s: (counts[s] * (1 - load[s] / capacity), -load[s]),
+        )
+        shard_of[node_id] = best
+        load[best] += 1
+
+    for _ in range(passes):
+        moved = 0
+        for node_id in order:
+            counts = neighbours_per_shard(node_id)
+            current = shard_of[node_id]
+            if load[current] <= floor:
+                continue
+            best = max(
+                (s for s in range(shards) if s == current or load[s] < capacity),
+                key=lambda s: counts[s],
+            )
+            if counts[best] > counts[current]:
+                shard_of[node_id] = best
+                load[current] -= 1
+                load[best] += 1
+                moved += 1
+        if not moved:
+            break
+    assert all(floor <= n <= capacity for n in load), f"unbalanced shards: {load}"
+    return shard_of
+
+
+def to_cross_shard_yaml(graph, shard_of, connection_type, v2=True):
+    """List the connections between shards, which no shard's network.yaml can express.
+
+    Entries mirror `to_network_yaml`: `type` is `manual` for addnode connections, and `v2` is
+    only given when false."""
+    edges = []
+    for node_id, target, is_manual in sorted(graph.edges(data="manual")):
+        if shard_of[node_id] == shard_of[target]:
+            continue
+        entry = {
+            "from": f"tank-{node_id:04d}",
+            "from_shard": shard_of[node_id],
+            "to": f"tank-{target:04d}",
+            "to_shard": shard_of[target],
+            "type": "manual" if is_manual else connection_type,
+        }
+        if not is_manual and not v2:
+            entry["v2"] = False
+        edges.append(entry)
+    return {"shards": max(shard_of) + 1, "edges": edges}
+
+
+def parse_distribution(spec):
+    """Parse `const:X`, `uniform:LOW:HIGH` or `lognormal:MEDIAN:SIGMA` into a sampler `f(rng)`."""
+    kind, _, params = spec.partition(":")
+    try:
+        values = [float(v) for v in params.split(":")] if params else []
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"non-numeric parameter in {spec!r}")
+    samplers = {
+        "const": (1, lambda rng: values[0]),
+        "uniform": (2, lambda rng: rng.uniform(values[0], values[1])),
+        "lognormal": (2, lambda rng: values[0] * rng.lognormvariate(0, values[1])),
+    }
+    if kind not in samplers or len(values) != samplers[kind][0]:
+        raise argparse.ArgumentTypeError(
+            f"invalid distribution {spec!r}; use const:X, uniform:LOW:HIGH or lognormal:MEDIAN:SIGMA"
+        )
+    return samplers[kind][1]
+
+
+def assign_links(graph, rng, latency=None, bandwidth=None, regions=False, jitter=0.1):
+    """Annotate every edge with `latency_ms` and `rate_mbit`, and nodes with their `region`.
+
+    Latency comes from the `latency` sampler or, with `regions`, from REGION_LATENCY_MS between
+    the endpoints' regions (scaled by a lognormal `jitter`). `bandwidth` is sampled per node, as
+    its access link, and an edge runs at the slower of its endpoints."""
+    if regions:
+        names = list(REGION_WEIGHTS)
+        for node_id in graph.nodes:
+            graph.nodes[node_id]["region"] = rng.choices(names, weights=REGION_WEIGHTS.values())[0]
+    if bandwidth is not None:
+        for node_id in graph.nodes:
+            graph.nodes[node_id]["rate_mbit"] = bandwidth(rng)
+
+    for u, v, data in graph.edges(data=True):
+        if regions:
+            pair = (graph.nodes[u]["region"], graph.nodes[v]["region"])
+            base = REGION_LATENCY_MS.get(pair, REGION_LATENCY_MS.get(pair[::-1]))
+            data["latency_ms"] = base * rng.lognormvariate(0, jitter)
+        elif latency is not None:
+            data["latency_ms"] = latency(rng)
+        if bandwidth is not None:
+            data["rate_mbit"] = min(graph.nodes[u]["rate_mbit"], graph.nodes[v]["rate_mbit"])
+
+
+def to_links_yaml(graph, size, seed):
+    """Render the link annotations as the companion links.yaml structure.
+
+    Each tank lists the shaping to apply on its egress towards every peer it is connected to
+    (in either direction), so a traffic-shaping stage only needs to look at its own entry."""
+    tanks = []
+    for node_id in range(size):
+        links = []
+        for peer in sorted(set(graph.successors(node_id)) | set(graph.predecessors(node_id))):
+            data = graph.get_edge_data(node_id, peer) or graph.get_edge_data(peer, node_id)
+            link = {"to": f"tank-{peer:04d}"}
+            if "latency_ms" in data:
+                link["delay_ms"] = round(data["latency_ms"], 1)
+            if "rate_mbit" in data:
+                link["rate_mbit"] = round(data["rate_mbit"], 1)
+            links.append(link)
+        tank = {"name": f"tank-{node_id:04d}"}
+        if "region" in graph.nodes[node_id]:
+            tank["region"] = graph.nodes[node_id]["region"]
+        tank["links"] = links
+        tanks.append(tank)
+    return {"seed": seed, "tanks": tanks}
+
+
+def from_network_yaml(network):
+    """Load a warnet network.yaml structure back into a DiGraph (the inverse of `to_network_yaml`).
+
+    Nodes are numbered in file order and carry their tank `name`, plus `blackhole` when their
+    `config` sets `blackhole=1`. Edges carry `manual` (addnode vs addconnection), their connection
+    `type` (`manual` for addnode) and `v2`. Works on any warnet network, not only generated ones."""
+    graph = nx.DiGraph()
+    index = {node["name"]: node_id for node_id, node in enumerate(network["nodes"])}
+    for node_id, node in enumerate(network["nodes"]):
+        blackhole = "blackhole=1" in node.get("config", "").split()
+        graph.add_node(node_id, name=node["name"], blackhole=blackhole)
+
+    def target(name, source):
+        if name not in index:
+            raise ValueError(f"{source} connects to unknown tank {name}")
+        return index[name]
+
+    for node_id, node in enumerate(network["nodes"]):
+        for name in node.get("addnode", []):
+            graph.add_edge(node_id, target(name, node["name"]), manual=True, type="manual", v2=True)
+        for entry in node.get("addconnection", []):
+            graph.add_edge(
+                node_id,
+                target(entry["to"], node["name"]),
+                manual=False,
+                type=entry.get("type", DEFAULT_CONNECTION_TYPE),
+                v2=entry.get("v2", True),
+            )
+    return graph
+
+
+def load_network(path):
+    """Read a network.yaml (or a network directory containing one) into a DiGraph."""
+    path = pathlib.Path(path)
+    if path.is_dir():
+        path = path / "network.yaml"
+    with open(path) as file:
+        return from_network_yaml(yaml.safe_load(file))
+
+
 def parse_args():
     parser = argparse.ArgumentParser(
         description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
@@ -238,6 +458,40 @@ def parse_args():
         default="network.yaml",
         help="Output file path (default: network.yaml)",
     )
+    links = parser.add_mutually_exclusive_group()
+    links.add_argument(
+        "--latency",
+        type=parse_distribution,
+        default=None,
+        help="One-way latency distribution per connection, in ms: const:X, uniform:LOW:HIGH or "
+        "lognormal:MEDIAN:SIGMA (default: no latency annotations)",
+    )
+    links.add_argument(
+        "--regions",
+        action="store_true",
+        help="Place nodes in world regions and take each connection's latency from the region "
+        "pair (see REGION_WEIGHTS / REGION_LATENCY_MS)",
+    )
+    parser.add_argument(
+        "--bandwidth",
+        type=parse_distribution,
+        default=None,
+        help="Access bandwidth distribution per node, in Mbit/s, same syntax as --latency; a "
+        "connection runs at the slower endpoint (default: no bandwidth annotations)",
+    )
+    parser.add_argument(
+        "-k",
+        "--shards",
+        type=int,
+        default=1,
+        help="Also split the network into this many shards with few cross-shard connections: "
+        "shard-<i>/network.yaml next to --output, plus cross-shard.yaml (default: 1, no split)",
+    )
+    parser.add_argument(
+        "--links-output",
+        default=None,
+        help="Companion link annotations file (default: links.yaml next to --output)",
+    )
     return parser.parse_args()
 
 
@@ -252,6 +506,8 @@ def main():
             args.recon_outbound,
             args.max_inbound,
         )
+        if not 0 < args.shards <= args.size:
+            raise InfeasibleNetwork(f"shards must satisfy 0 < shards <= size (got shards={args.shards})")
         rng = Random(args.seed)  # Defaults to Random(None), which seeds from OS entropy
         graph, attempts = build_network(
             args.size,
@@ -282,6 +538,38 @@ def main():
             )
         )
 
+    if args.shards > 1:
+        shard_of = partition_graph(graph, args.shards)
+        outdir = pathlib.Path(args.output).parent
+        for shard in range(args.shards):
+            node_ids = [n for n in range(args.size) if shard_of[n] == shard]
+            shard_dir = outdir / f"shard-{shard}"
+            shard_dir.mkdir(parents=True, exist_ok=True)
+            (shard_dir / "network.yaml").write_text(
+                yaml.dump(
+                    to_network_yaml(graph, args.size, args.connection_type, args.v2, node_ids),
+                    sort_keys=False,
+                )
+            )
+        cross = to_cross_shard_yaml(graph, shard_of, args.connection_type, args.v2)
+        (outdir / "cross-shard.yaml").write_text(yaml.dump(cross, sort_keys=False))
+        sizes = [shard_of.count(shard) for shard in range(args.shards)]
+        print(
+            f"wrote {args.shards} shards to {outdir}/shard-*: sizes {sizes}, "
+            f"{len(cross['edges'])}/{graph.number_of_edges()} connections cross shards "
+            f"(listed in {outdir / 'cross-shard.yaml'})",
+            file=sys.stderr,
+        )
+
+    if args.latency or args.regions or args.bandwidth:
+        # Draw links from their own stream, so annotating a network never changes its topology
+        link_rng = Random(None if args.seed is None else args.seed + 1)
+        assign_links(graph, link_rng, args.latency, args.bandwidth, args.regions)
+        links_output = args.links_output or pathlib.Path(args.output).with_name("links.yaml")
+        with open(links_output, "w") as file:
+            file.write(yaml.dump(to_links_yaml(graph, args.size, args.seed), sort_keys=False))
+        print(f"wrote {links_output}: per-tank link shaping", file=sys.stderr)
+
     inbound_counts = [graph.in_degree(r) for r in range(args.reachable)]
     total_edges = args.size * (args.outbound + args.recon_outbound)
     print(
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Compute the connection diff that turns one deployed network arm into another.
+
+Arms generated from the same seed share their tanks and most of their connections
+(create_network.py arms share the addnode base; create_eclipse_network.py relay/recon arms
+only differ in link type), so switching arms only needs a handful of RPCs instead of a full
+redeploy. Prints, as JSON, the connections to remove and add per tank, plus the full outbound
+peer set every tank must end up with, for scenarios/switch_arm.py to apply and verify:
+
+  warnet run scenarios/switch_arm.py \\
+      --diff "$(python utils/diff_networks.py networks/eclipse-relay networks/eclipse-recon)"
+"""
+
+import argparse
+import json
+import sys
+
+import create_network
+
+
+def outbound_links(graph):
+    """Map every tank to its outbound connections, as {(peer name, type): v2}."""
+    names = [graph.nodes[n]["name"] for n in graph.nodes]
+    links = {name: {} for name in names}
+    for u, v, data in graph.edges(data=True):
+        links[names[u]][(names[v], data["type"])] = data["v2"]
+    return links
+
+
+def diff_networks(source, target):
+    """Diff two network graphs. Connections are keyed by (from, to, type), so a type change is a
+    removal plus an addition; the tank sets must match."""
+    before, after = outbound_links(source), outbound_links(target)
+    if set(before) != set(after):
+        missing = sorted(set(before) ^ set(after))
+        raise ValueError(f"the networks have different tanks: {', '.join(missing[:5])}")
+
+    diff = {"remove": {}, "add": {}, "expect": {}}
+    for tank in after:
+        removed = [
+            {"to": to, "type": conn_type}
+            for (to, conn_type), v2 in before[tank].items()
+            if after[tank].get((to, conn_type)) != v2
+        ]
+        added = [
+            {"to": to, "type": conn_type, "v2": v2}
+            for (to, conn_type), v2 in after[tank].items()
+            if before[tank].get((to, conn_type)) != v2
+        ]
+        if removed:
+            diff["remove"][tank] = removed
+        if added:
+            diff["add"][tank] = added
+        diff["expect"][tank] = sorted([to, conn_type] for to, conn_type in after[tank])
+    return diff
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("source", help="Deployed network.yaml, or a network directory containing one")
+    parser.add_argument("target", help="Network to switch to")
+    parser.add_argument("-O", "--output", default=None, help="Output file path (default: stdout)")
+    args = parser.parse_args()
+
+    try:
+        diff = diff_networks(create_network.load_network(args.source), create_network.load_network(args.target))
+    except (OSError, ValueError) as e:
+        sys.exit(f"error: {e}")
+
+    removals = sum(len(links) for links in diff["remove"].values())
+    additions = sum(len(links) for links in diff["add"].values())
+    text = json.dumps(diff, separators=(",", ":"))
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text)
+    else:
+        print(text)
+    print(
+        f"{args.source} -> {args.target}: {removals} connections to remove, {additions} to add "
+        f"across {len(set(diff['remove']) | set(diff['add']))} tanks",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""Offline counterpart of scenarios/check_eclipse.py, over many randomized trials.
+
+Runs the relay model of simulate_relay.py on the `eclipse-{control,relay,recon}` networks of
+create_eclipse_network.py: blackholes receive and keep everything but forward nothing, and the
+victim only hears from the honest mesh through its lifeline (addconnection) links. Each trial
+broadcasts `--tx-count` transactions from a random honest node, with fresh trickle and
+reconciliation timers, and the victim survives it if it receives all of them within
+`--timeout` seconds (block relay is not modelled).
+
+`--lifelines` rewires the victim to that many random reachable honest nodes on every trial,
+so lifeline counts and `--recon-interval` values can be swept without regenerating networks.
+Trials run in parallel across `--jobs` processes.
+
+  python utils/simulate_eclipse.py networks/eclipse-{control,relay,recon} --trials 2000
+"""
+
+import argparse
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from random import Random
+
+import numpy as np
+
+import create_network
+import simulate_relay
+
+VICTIM = "victim"
+
+# Per-process state, set up once by `init_worker`
+_trial = {}
+
+
+def rewire_victim(graph, victim, lifelines, conn_type, rng):
+    """Replace the victim's addconnection links with `lifelines` links of `conn_type` to random
+    reachable honest nodes (those accepting inbound connections from the honest mesh)."""
+    extras = [(victim, t) for _, t, manual in graph.out_edges(victim, data="manual") if not manual]
+    graph.remove_edges_from(extras)
+    reachable = [
+        n
+        for n in graph.nodes
+        if n != victim
+        and not graph.nodes[n]["blackhole"]
+        and any(not graph.nodes[s]["blackhole"] for s in graph.predecessors(n))
+    ]
+    if lifelines > len(reachable):
+        raise ValueError(f"cannot pick {lifelines} lifelines among {len(reachable)} reachable honest nodes")
+    for target in rng.sample(reachable, lifelines):
+        graph.add_edge(victim, target, manual=False, type=conn_type, v2=True)
+
+
+def init_worker(graph, victim, args):
+    _trial.update(graph=graph, victim=victim, args=args)
+
+
+def run_trial(seed):
+    """Run a single trial; returns (txs the victim received, seconds until it had them all)."""
+    graph, victim, args = _trial["graph"], _trial["victim"], _trial["args"]
+    rng = Random(seed)
+    if args.lifelines is not None:
+        graph = graph.copy()
+        rewire_victim(graph, victim, args.lifelines, args.lifeline_type, rng)
+    sim = simulate_relay.RelaySimulator(
+        graph,
+        transport=args.transport,
+        latency=args.latency,
+        recon_interval=args.recon_interval,
+        q=args.q,
+        rng=rng,
+    )
+    honest = [n for n in graph.nodes if n != victim and not sim.blackhole[n]]
+    schedule = [(0.0, rng.choice(honest), list(range(args.tx_count)))]
+    _, arrivals = sim.run(schedule, args.tx_count, max_time=args.timeout, watch=[victim])
+    received = arrivals[victim][~np.isnan(arrivals[victim])]
+    elapsed = float(received.max()) if received.size == args.tx_count else math.nan
+    return int(received.size), elapsed
+
+
+def wilson_interval(successes, trials, z=1.96):
+    """95% Wilson score interval of a binomial proportion."""
+    if not trials:
+        return 0.0, 0.0
+    p = successes / trials
+    centre = (p + z * z / (2 * trials)) / (1 + z * z / trials)
+    spread = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / (1 + z * z / trials)
+    return max(0.0, centre - spread), min(1.0, centre + spread)
+
+
+def simulate_arm(path, args):
+    graph = create_network.load_network(path)
+    victim = next((n for n in graph.nodes if graph.nodes[n]["name"] == VICTIM), None)
+    if victim is None:
+        raise ValueError(f"no {VICTIM} node; generate the network with create_eclipse_network.py")
+
+    base = Random(args.seed).randrange(2**63)
+    seeds = [base ^ i for i in range(args.trials)]
+    initargs = (graph, victim, args)
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=init_worker, initargs=initargs) as pool:
+        results = list(pool.map(run_trial, seeds, chunksize=max(1, args.trials // (4 * args.jobs))))
+
+    received = np.array([r for r, _ in results])
+    elapsed = np.array([e for _, e in results])
+    survived = int((~np.isnan(elapsed)).sum())
+    low, high = wilson_interval(survived, args.trials)
+    lines = [
+        f"{path}: {args.trials} trials, {args.tx_count} txs each",
+        f"  survival probability  : {survived / args.trials:.3f} (95% CI {low:.3f}-{high:.3f})",
+        f"  transactions received : mean {received.mean():.1f}/{args.tx_count}",
+    ]
+    if survived:
+        p50, p90, p99 = np.percentile(elapsed[~np.isnan(elapsed)], [50, 90, 99])
+        lines.append(f"  time to receive all   : p50={p50:.1f}s p90={p90:.1f}s p99={p99:.1f}s "
+                     f"max={np.nanmax(elapsed):.1f}s")
+    else:
+        lines.append(f"  time to receive all   : NOT all within {args.timeout}s in any trial")
+    return "\n".join(lines)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "networks", nargs="+", help="eclipse network.yaml files, or network directories containing one"
+    )
+    parser.add_argument("--trials", type=int, default=1000, help="Trials per network (default: 1000)")
+    parser.add_argument(
+        "--tx-count", type=int, default=20, help="Transactions broadcast per trial (default: 20)"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=180,
+        help="Seconds the victim has to receive every transaction (default: 180)",
+    )
+    parser.add_argument(
+        "--lifelines",
+        type=int,
+        default=None,
+        help="Rewire the victim to this many random honest lifelines per trial "
+        "(default: keep the network's wiring)",
+    )
+    parser.add_argument(
+        "--lifeline-type",
+        default=create_network.RECON_CONNECTION_TYPE,
+        help=f"Connection type of rewired lifelines (default: {create_network.RECON_CONNECTION_TYPE})",
+    )
+    parser.add_argument(
+        "--recon-interval",
+        type=float,
+        default=simulate_relay.RECON_REQUEST_INTERVAL,
+        help=f"Seconds between reconciliation rounds per node (default: {simulate_relay.RECON_REQUEST_INTERVAL})",
+    )
+    parser.add_argument(
+        "--q",
+        type=float,
+        default=simulate_relay.DEFAULT_Q,
+        help=f"Sketch capacity estimate coefficient (default: {simulate_relay.DEFAULT_Q})",
+    )
+    parser.add_argument(
+        "--transport",
+        choices=tuple(simulate_relay.INV_OVERHEAD_BY_TRANSPORT),
+        default="v2",
+        help="Transport all connections use (default: v2)",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.001,
+        help="One-way latency of every message, in seconds (default: 0.001, in-cluster)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Worker processes (default: one per core)",
+    )
+    parser.add_argument("--seed", type=int, default=1337, help="RNG seed (default: 1337)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.trials < 1 or args.tx_count < 1 or args.jobs < 1:
+        sys.exit("error: --trials, --tx-count and --jobs must be >= 1")
+    if args.lifelines is not None and args.lifelines < 0:
+        sys.exit("error: --lifelines must be >= 0")
+
+    reports = []
+    for path in args.networks:
+        try:
+            reports.append(simulate_arm(path, args))
+        except (OSError, ValueError) as e:
+            sys.exit(f"error: {path}: {e}")
+    print("\n\n".join(reports))
+
+
+if __name__ == "__main__":
+    main()
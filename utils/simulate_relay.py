@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""Discrete-event simulation of transaction relay over a warnet network.yaml.
+
+Predicts what check_net_bandwidth.py measures on a live deployment (per-message-type counts
+and bytes, propagation time) straight from a network file, modelling Bitcoin Core relay as
+run by the experiment image:
+
+  fanout : every link but outbound-full-recon announces new transactions via inv, batched on
+           Poisson trickle timers (one per outbound peer, mean 2s; one shared by all inbound
+           peers, mean 5s). Unknown announcements are fetched with getdata/tx.
+  recon  : outbound-full-recon links announce nothing; transactions go to a per-peer
+           reconciliation set instead. Every `--recon-interval` seconds each node reconciles
+           with its next outbound recon peer (round robin): reqtxrcncl -> sketch
+           (-> reqsketchext -> sketch) -> reconcildiff, and the decoded differences are
+           announced via inv. A sketch decodes when the set difference fits its (BIP-330
+           estimated) capacity; if the extension fails too, both sides announce their sets.
+
+Links are undirected once established and every message takes `--latency` seconds. Nodes
+flagged as blackholes (`blackhole=1` in their config) receive and keep everything but forward
+nothing. State lives in (nodes x txs) arrays and announcements are handled in batches, so
+the event count scales with messages rather than with transactions.
+
+  python utils/simulate_relay.py networks/conn-redundancy-recon --tx-count 50 --n 5
+"""
+
+import argparse
+import heapq
+import itertools
+import statistics
+import sys
+from collections import Counter
+from random import Random
+
+import numpy as np
+
+import create_network
+
+# Per-inv-message byte overhead (all but the entries), by transport, and the size of each
+# entry, as in scenarios/check_net_bandwidth.py:
+# v1 = 24 header + 1 count; v2 = 3 len + 1 header + 1 msg-type + 16 MAC + 1 count.
+INV_OVERHEAD_BY_TRANSPORT = {"v1": 25, "v2": 22}
+# 4-byte INV type + 32-byte hash
+INV_ENTRY_SIZE = 36
+# Framing of any other message: the inv overhead without its count. BIP-330 messages have no
+# BIP324 short id, so v2 spells out their 12-byte type after a 0x00 marker instead.
+FRAMING_BY_TRANSPORT = {t: overhead - 1 for t, overhead in INV_OVERHEAD_BY_TRANSPORT.items()}
+ERLAY_FRAMING_BY_TRANSPORT = {"v1": 24, "v2": 3 + 1 + 1 + 12 + 16}
+# reqtxrcncl payload: uint16 set size + uint16 q
+REQTXRCNCL_SIZE = 4
+# Sketch elements are 32-bit short ids
+SHORTID_SIZE = 4
+
+# Trickle means, in seconds (net_processing.cpp)
+OUTBOUND_INVENTORY_BROADCAST_INTERVAL = 2.0
+INBOUND_INVENTORY_BROADCAST_INTERVAL = 5.0
+# Seconds between reconciliation rounds initiated by a node (txreconciliation.h)
+RECON_REQUEST_INTERVAL = 8.0
+# Coefficient of the sketch capacity estimate (BIP-330)
+DEFAULT_Q = 0.25
+# Serialized size of the 1in-4out transactions created by check_net_bandwidth.py
+DEFAULT_TX_SIZE = 284
+# Resolution of the arrival latency histogram, in seconds
+LATENCY_BIN = 0.01
+
+# Event kinds, in tie-break order
+BROADCAST, TX, INV, FLUSH_PEER, FLUSH_INBOUND, ROUND = range(6)
+
+EMPTY = np.empty(0, dtype=np.int64)
+
+
+def compact_size_len(n):
+    return 1 if n < 253 else 3 if n <= 0xFFFF else 5
+
+
+def sketch_capacity(local, remote, q):
+    """Capacity the responder picks for its sketch given both set sizes (BIP-330)."""
+    return abs(local - remote) + int(q * min(local, remote)) + 1
+
+
+class RelaySimulator:
+    """Event-driven relay model of a single network; see the module docstring.
+
+    `run` can be called repeatedly (e.g. once per iteration); counters accumulate, so take the
+    difference between runs, as check_net_bandwidth.py does with getnetmsgstats."""
+
+    def __init__(
+        self,
+        graph,
+        *,
+        transport="v2",
+        latency=0.001,
+        tx_size=DEFAULT_TX_SIZE,
+        recon_interval=RECON_REQUEST_INTERVAL,
+        q=DEFAULT_Q,
+        rng=None,
+    ):
+        self.size = graph.number_of_nodes()
+        self.blackhole = [bool(graph.nodes[n].get("blackhole", False)) for n in range(self.size)]
+        self.latency = latency
+        self.tx_size = tx_size
+        self.recon_interval = recon_interval
+        self.q = q
+        self.rng = rng or Random()
+        self.framing = FRAMING_BY_TRANSPORT[transport]
+        self.erlay_framing = ERLAY_FRAMING_BY_TRANSPORT[transport]
+
+        # Every link is split into two half-links: 2e goes from the node that opened the
+        # connection to its peer, 2e+1 goes back. `h ^ 1` is the reverse of `h`.
+        self.dst, self.outbound, self.recon = [], [], []
+        self.out_halves = [[] for _ in range(self.size)]
+        self.recon_outbound = [[] for _ in range(self.size)]
+        seen = set()
+        for u, v, conn_type in graph.edges(data="type"):
+            if (v, u) in seen or u == v:
+                continue
+            seen.add((u, v))
+            recon = conn_type == create_network.RECON_CONNECTION_TYPE
+            for src, dst, outbound in ((u, v, True), (v, u, False)):
+                self.out_halves[src].append(len(self.dst))
+                self.dst.append(dst)
+                self.outbound.append(outbound)
+                self.recon.append(recon)
+            if recon:
+                self.recon_outbound[u].append(len(self.dst) - 2)
+        halves = len(self.dst)
+        self.src = [self.dst[h ^ 1] for h in range(halves)]
+        # Transactions queued for the next trickle (fanout) or reconciliation round (recon)
+        self.queue = [[] for _ in range(halves)]
+        # Transactions the peer announced to us, so we must not announce them back
+        self.heard = [[] for _ in range(halves)]
+        self.flush_scheduled = [False] * halves
+        self.inbound_flush_scheduled = [False] * self.size
+        self.next_recon_peer = [0] * self.size
+
+        self.count = Counter()
+        self.bytes = Counter()
+        self.now = 0.0
+
+    def _push(self, at, kind, arg, ids=EMPTY):
+        heapq.heappush(self.events, (at, kind, next(self.seq), arg, ids))
+
+    def _send(self, msgtype, nbytes, count=1):
+        self.count[msgtype] += count
+        self.bytes[msgtype] += nbytes
+
+    def _take(self, h):
+        """Drain the queue of half-link `h`, dropping what the peer already announced to us."""
+        chunks, self.queue[h] = self.queue[h], []
+        if not chunks:
+            return EMPTY
+        ids = chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+        if self.heard[h]:
+            heard = np.concatenate(self.heard[h])
+            ids = ids[~np.isin(ids, heard)]
+            # Only keep what is still in flight towards us; it may be queued later
+            heard = heard[~self.known[self.src[h], heard]]
+            self.heard[h] = [heard] if heard.size else []
+        return ids
+
+    def _announce(self, h, ids, at):
+        if not ids.size:
+            return
+        self._send("inv", self.framing + compact_size_len(ids.size) + INV_ENTRY_SIZE * ids.size)
+        self.inv_entries += ids.size
+        self._push(at + self.latency, INV, h, ids)
+
+    def _receive(self, node, ids, from_half):
+        ids = ids[~self.known[node, ids]]
+        if not ids.size:
+            return
+        self.known[node, ids] = True
+        self.requested[node, ids] = True
+        if self.target[node]:
+            self.remaining -= ids.size
+            bins = ((self.now - self.broadcast_time[ids]) / LATENCY_BIN).astype(np.int64)
+            np.add.at(self.histogram, np.minimum(bins, self.histogram.size - 1), 1)
+            np.maximum.at(self.last_arrival, ids, self.now)
+        if node in self.watched:
+            self.watched[node][ids] = self.now
+        if self.blackhole[node]:
+            return
+
+        for g in self.out_halves[node]:
+            if g == from_half:
+                continue
+            self.queue[g].append(ids)
+            if self.recon[g]:
+                continue
+            if self.outbound[g]:
+                if not self.flush_scheduled[g]:
+                    self.flush_scheduled[g] = True
+                    delay = self.rng.expovariate(1 / OUTBOUND_INVENTORY_BROADCAST_INTERVAL)
+                    self._push(self.now + delay, FLUSH_PEER, g)
+            elif not self.inbound_flush_scheduled[node]:
+                self.inbound_flush_scheduled[node] = True
+                delay = self.rng.expovariate(1 / INBOUND_INVENTORY_BROADCAST_INTERVAL)
+                self._push(self.now + delay, FLUSH_INBOUND, node)
+
+    def _on_inv(self, h, ids):
+        node, back = self.dst[h], h ^ 1
+        # Remember the peer knows these, unless they can no longer be queued towards it
+        pending = ids if self.queue[back] else ids[~self.known[node, ids]]
+        if pending.size:
+            self.heard[back].append(pending)
+        new = ids[~self.requested[node, ids]]
+        if not new.size:
+            return
+        self.requested[node, new] = True
+        self._send("getdata", self.framing + compact_size_len(new.size) + INV_ENTRY_SIZE * new.size)
+        self._send("tx", (self.framing + self.tx_size) * new.size, count=new.size)
+        self._push(self.now + 2 * self.latency, TX, h, new)
+
+    def _on_round(self, node):
+        peers = self.recon_outbound[node]
+        h = peers[self.next_recon_peer[node] % len(peers)]
+        self.next_recon_peer[node] += 1
+        if self.remaining:
+            self._push(self.now + self.recon_interval, ROUND, node)
+
+        ours, theirs = self._take(h), self._take(h ^ 1)
+        capacity = sketch_capacity(theirs.size, ours.size, self.q)
+        sketch = self.erlay_framing + compact_size_len(SHORTID_SIZE * capacity) + SHORTID_SIZE * capacity
+        only_ours = np.setdiff1d(ours, theirs, assume_unique=True)
+        only_theirs = np.setdiff1d(theirs, ours, assume_unique=True)
+        difference = only_ours.size + only_theirs.size
+
+        self._send("reqtxrcncl", self.erlay_framing + REQTXRCNCL_SIZE)
+        self._send("sketch", sketch)
+        # Round trips so far: reqtxrcncl/sketch, and reqsketchext/sketch if extended
+        trips = 1
+        if difference > capacity:
+            self._send("reqsketchext", self.erlay_framing)
+            self._send("sketch", sketch)
+            trips = 2
+        if difference > 2 * capacity:
+            self.recon_failures += 1
+            self._send("reconcildiff", self.erlay_framing + 1 + compact_size_len(0))
+            only_ours, only_theirs = ours, theirs
+        else:
+            self._send(
+                "reconcildiff",
+                self.erlay_framing + 1 + compact_size_len(only_theirs.size) + SHORTID_SIZE * only_theirs.size,
+            )
+        done = self.now + 2 * trips * self.latency
+        self._announce(h, only_ours, done)
+        self._announce(h ^ 1, only_theirs, done + self.latency)
+
+    def run(self, schedule, txs, max_time=float("inf"), watch=()):
+        """Simulate `schedule`, a list of (time, source node, tx ids) broadcasts of `txs`
+        transactions, until every non-blackhole node has them all or `max_time` elapses.
+
+        Returns the per-tx full propagation times (NaN if never complete) and, for every node in
+        `watch`, its per-tx arrival times relative to the broadcast (NaN if never received)."""
+        self.events, self.seq = [], itertools.count()
+        self.known = np.zeros((self.size, txs), dtype=bool)
+        self.requested = np.zeros((self.size, txs), dtype=bool)
+        self.broadcast_time = np.zeros(txs)
+        self.last_arrival = np.zeros(txs)
+        self.histogram = np.zeros(int(min(max_time, 3600) / LATENCY_BIN) + 1, dtype=np.int64)
+        self.watched = {node: np.full(txs, np.nan) for node in watch}
+        self.target = [not bh for bh in self.blackhole]
+        self.remaining = sum(self.target) * txs
+        self.inv_entries = 0
+        self.recon_failures = 0
+        for queue in (self.queue, self.heard):
+            for h in range(len(queue)):
+                queue[h] = []
+        self.flush_scheduled = [False] * len(self.dst)
+        self.inbound_flush_scheduled = [False] * self.size
+
+        for at, source, ids in schedule:
+            ids = np.asarray(ids, dtype=np.int64)
+            self.broadcast_time[ids] = at
+            self._push(at, BROADCAST, source, ids)
+        start = min((at for at, _, _ in schedule), default=0.0)
+        for node in range(self.size):
+            if self.recon_outbound[node]:
+                self._push(start + self.rng.uniform(0, self.recon_interval), ROUND, node)
+
+        while self.events and self.remaining:
+            self.now, kind, _, arg, ids = heapq.heappop(self.events)
+            if self.now > max_time:
+                break
+            if kind == BROADCAST:
+                self._receive(arg, ids, None)
+            elif kind == TX:
+                self._receive(self.dst[arg], ids, arg ^ 1)
+            elif kind == INV:
+                self._on_inv(arg, ids)
+            elif kind == FLUSH_PEER:
+                self.flush_scheduled[arg] = False
+                self._announce(arg, self._take(arg), self.now)
+            elif kind == FLUSH_INBOUND:
+                self.inbound_flush_scheduled[arg] = False
+                for g in self.out_halves[arg]:
+                    if not self.outbound[g] and not self.recon[g] and self.queue[g]:
+                        self._announce(g, self._take(g), self.now)
+            elif kind == ROUND:
+                self._on_round(arg)
+
+        complete = self.known[np.array(self.target)].all(axis=0)
+        propagation = np.where(complete, self.last_arrival - self.broadcast_time, np.nan)
+        arrivals = {node: times - self.broadcast_time for node, times in self.watched.items()}
+        return propagation, arrivals
+
+    def latency_percentile(self, p):
+        """Per-(node, tx) arrival latency percentile of the last run, at LATENCY_BIN resolution."""
+        cumulative = np.cumsum(self.histogram)
+        if not cumulative[-1]:
+            return None
+        return float(np.searchsorted(cumulative, p / 100 * cumulative[-1])) * LATENCY_BIN
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("network", help="network.yaml file, or a network directory containing one")
+    parser.add_argument(
+        "--tx-count",
+        type=int,
+        default=80,
+        help="Transactions broadcast per iteration, round robin across nodes (default: 80)",
+    )
+    parser.add_argument(
+        "--tx-rate",
+        type=float,
+        default=0,
+        help="Broadcast rate in tx/s; 0 broadcasts them all at once, as check_net_bandwidth.py "
+        "does (default: 0)",
+    )
+    parser.add_argument(
+        "--n", type=int, default=1, help="Number of times the simulation is repeated (default: 1)"
+    )
+    parser.add_argument(
+        "--transport",
+        choices=tuple(INV_OVERHEAD_BY_TRANSPORT),
+        default="v2",
+        help="Transport all connections use; selects the message framing (default: v2)",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.001,
+        help="One-way latency of every message, in seconds (default: 0.001, in-cluster)",
+    )
+    parser.add_argument(
+        "--recon-interval",
+        type=float,
+        default=RECON_REQUEST_INTERVAL,
+        help=f"Seconds between reconciliation rounds per node (default: {RECON_REQUEST_INTERVAL})",
+    )
+    parser.add_argument(
+        "--q",
+        type=float,
+        default=DEFAULT_Q,
+        help=f"Sketch capacity estimate coefficient (default: {DEFAULT_Q})",
+    )
+    parser.add_argument(
+        "--tx-size",
+        type=int,
+        default=DEFAULT_TX_SIZE,
+        help=f"Serialized transaction size in bytes (default: {DEFAULT_TX_SIZE})",
+    )
+    parser.add_argument(
+        "--max-time",
+        type=float,
+        default=600,
+        help="Simulated seconds before an iteration gives up (default: 600)",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=None, help="RNG seed for reproducible simulations"
+    )
+    return parser.parse_args()
+
+
+def broadcast_schedule(sources, tx_count, tx_rate, rng):
+    """Broadcast times and round-robin sources, mirroring CheckNetBandwidth.broadcast_txs."""
+    if not tx_rate:
+        by_source = {}
+        for tx in range(tx_count):
+            by_source.setdefault(sources[tx % len(sources)], []).append(tx)
+        return [(0.0, source, ids) for source, ids in by_source.items()]
+    schedule, at = [], 0.0
+    for tx in range(tx_count):
+        schedule.append((at, sources[tx % len(sources)], [tx]))
+        at += rng.expovariate(tx_rate)
+    return schedule
+
+
+def main():
+    args = parse_args()
+    if args.n < 1 or args.tx_count < 1:
+        sys.exit(f"error: --n and --tx-count must be >= 1 (got n={args.n}, tx-count={args.tx_count})")
+
+    try:
+        graph = create_network.load_network(args.network)
+    except (OSError, ValueError) as e:
+        sys.exit(f"error: {args.network}: {e}")
+    rng = Random(args.seed)
+    sim = RelaySimulator(
+        graph,
+        transport=args.transport,
+        latency=args.latency,
+        tx_size=args.tx_size,
+        recon_interval=args.recon_interval,
+        q=args.q,
+        rng=rng,
+    )
+    sources = [n for n in range(sim.size) if not sim.blackhole[n]]
+
+    inv_entries, propagation, failures, p50, p99 = [], [], 0, [], []
+    for i in range(args.n):
+        schedule = broadcast_schedule(sources, args.tx_count, args.tx_rate, rng)
+        times, _ = sim.run(schedule, args.tx_count, args.max_time)
+        if np.isnan(times).any():
+            print(f"iter {i + 1}: {np.isnan(times).sum()}/{args.tx_count} txs did not reach every "
+                  f"node within {args.max_time}s", file=sys.stderr)
+        propagation.append(float(np.nanmax(times)) if not np.isnan(times).all() else float("nan"))
+        inv_entries.append(sim.inv_entries)
+        failures += sim.recon_failures
+        p50.append(sim.latency_percentile(50))
+        p99.append(sim.latency_percentile(99))
+
+    def tidy(total):
+        avg = round(total / args.n, 2)
+        return int(avg) if avg.is_integer() else avg
+
+    rounds = sim.count["reqtxrcncl"]
+    print(f"message count per type: { {k: tidy(v) for k, v in sim.count.items()} }")
+    print(f"bytes per message type: { {k: tidy(v) for k, v in sim.bytes.items()} }")
+    print(f"INV entry count: {statistics.mean(inv_entries)}")
+    print(f"approx propagation time: {statistics.mean(propagation):.3f}s "
+          f"(per-node arrival p50={statistics.mean(p50):.2f}s p99={statistics.mean(p99):.2f}s)")
+    if rounds:
+        print(f"reconciliations: {rounds / args.n:g} per iter, "
+              f"{100 * (rounds - sim.count['reqsketchext']) / rounds:.0f}% without extension, "
+              f"{failures / args.n:g} failed")
+
+
+if __name__ == "__main__":
+    main()